@@ -33,7 +33,8 @@ Essendo un prototipo del prodotto finale bisogna configurare "a mano" l'ambiente
 // Configurazione WiFi
 const char* ssid = "POCO F3";
 const char* password = "280901sal";
-const char* serverUrl = "http://192.168.208.157:8000/receive-data";
+// ack=compact: il server risponde solo con status, auction_id e sequence_number, non con lo stato dell'asta
+const char* serverUrl = "http://192.168.208.157:8000/receive-data?ack=compact";
 
 // Crea un'istanza dell'oggetto LiquidCrystal_I2C
 // (Indirizzo I2C, Numero colonne, Numero righe)
@@ -0,0 +1,389 @@
+import asyncio
+import os
+from fastapi import HTTPException
+import logger
+from bids import MAX_AUCTIONS_PAGE
+
+try:
+    import numpy as np
+except ImportError:  # Senza numpy gli endpoint delle analisi rispondono 503
+    np = None
+
+# Cartella con le colonne delle offerte delle aste concluse, un file npz per ogni blocco aggiunto
+# (vuoto: cache solo in memoria)
+ANALYTICS_PATH = os.environ.get("ANALYTICS_PATH", "analytics")
+# Oltre questo numero di file la cache viene riscritta in un file solo
+ANALYTICS_MAX_SEGMENTS = int(os.environ.get("ANALYTICS_MAX_SEGMENTS", "64"))
+SEGMENT_PREFIX = "bids-"
+# Punti predefiniti e massimi di una serie restituita al client
+SERIES_POINTS = 200
+MAX_SERIES_POINTS = 2000
+# Mittenti restituiti con i tassi di vittoria
+SENDERS_LIMIT = 20
+# Percentili dei tempi tra offerte successive della stessa asta
+INTER_ARRIVAL_PERCENTILES = (50, 90, 99)
+
+# Colonne della cache: una riga per asta conclusa, poi una riga per offerta, con le offerte
+# di ogni asta consecutive e nello stesso ordine delle aste
+COLUMNS = {
+    "auction_id": "int64",
+    "winning_bid": "float64",
+    "winner_id": "int64",
+    "bid_count": "int64",
+    "bid_value": "float64",
+    "bid_sender_id": "int64",
+    "bid_sequence_number": "int64",
+    "bid_received_at": "float64"  # NaN per le offerte salvate senza received_at
+}
+BID_COLUMNS = ("bid_value", "bid_sender_id", "bid_sequence_number", "bid_received_at")
+
+def require_numpy():
+    if np is None:
+        raise HTTPException(status_code=503, detail="Bid analytics require the numpy package")
+
+def empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+def auction_columns(documents):
+    """
+    Colonne di una serie di aste concluse (documenti completi, con lo storico delle offerte).
+    """
+    bids = [bid for document in documents for bid in document.get("bid_history", [])]
+    return {
+        "auction_id": np.array([document["auction_id"] for document in documents], dtype=COLUMNS["auction_id"]),
+        "winning_bid": np.array([document["highest_bid"] for document in documents], dtype=COLUMNS["winning_bid"]),
+        "winner_id": np.array([document["winner_id"] for document in documents], dtype=COLUMNS["winner_id"]),
+        "bid_count": np.array([len(document.get("bid_history", [])) for document in documents], dtype=COLUMNS["bid_count"]),
+        "bid_value": np.array([bid["bid"] for bid in bids], dtype=COLUMNS["bid_value"]),
+        "bid_sender_id": np.array([bid["sender_id"] for bid in bids], dtype=COLUMNS["bid_sender_id"]),
+        "bid_sequence_number": np.array([bid["sequence_number"] for bid in bids], dtype=COLUMNS["bid_sequence_number"]),
+        "bid_received_at": np.array([bid.get("received_at", np.nan) for bid in bids], dtype=COLUMNS["bid_received_at"])
+    }
+
+def concatenate_columns(parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+def select_auctions(columns, keep):
+    """
+    Colonne delle sole aste con keep True, insieme alle loro offerte.
+    """
+    keep_bids = np.repeat(keep, columns["bid_count"])
+    return {name: values[keep_bids if name in BID_COLUMNS else keep] for name, values in columns.items()}
+
+# Le funzioni seguenti sono chiamate bloccanti, da eseguire nel pool di thread
+
+def segment_numbers(path):
+    """
+    Numeri dei file della cache nella cartella, in ordine di scrittura.
+    """
+    if not path or not os.path.isdir(path):
+        return []
+    numbers = []
+    for name in os.listdir(path):
+        number = name[len(SEGMENT_PREFIX):-len(".npz")]
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(".npz") and number.isdigit():
+            numbers.append(int(number))
+    return sorted(numbers)
+
+def segment_path(path, number):
+    return os.path.join(path, f"{SEGMENT_PREFIX}{number}.npz")
+
+def read_columns(path, fingerprint):
+    """
+    Legge la cache dai file npz della cartella. Quelli non validi o scritti per un altro database (fingerprint diverso)
+    vengono saltati, e un'asta presente in più file (es. compattazione interrotta) resta una volta sola.
+    Restituisce le colonne, i numeri di tutti i file trovati e se erano tutti validi.
+    """
+    numbers = segment_numbers(path)
+    parts = [empty_columns()]
+    for number in numbers:
+        try:
+            with np.load(segment_path(path, number)) as cached:
+                if str(cached["fingerprint"]) == fingerprint:
+                    parts.append({name: cached[name].astype(dtype, copy=False) for name, dtype in COLUMNS.items()})
+        except Exception as e:
+            logger.error("analytics_cache_invalid", path=segment_path(path, number), error=str(e))
+    columns = concatenate_columns(parts)
+    _, first = np.unique(columns["auction_id"], return_index=True)
+    keep = np.zeros(len(columns["auction_id"]), dtype=bool)
+    keep[first] = True
+    if not keep.all():
+        columns = select_auctions(columns, keep)
+    return columns, numbers, len(parts) == len(numbers) + 1 and keep.all()
+
+def write_segment(path, number, columns, fingerprint):
+    """
+    Scrive un file della cache, visibile con il suo nome solo a scrittura completata.
+    """
+    os.makedirs(path, exist_ok=True)
+    temporary = segment_path(path, number) + ".tmp"
+    with open(temporary, "wb") as cache_file:
+        np.savez(cache_file, fingerprint=np.array(fingerprint), **columns)
+    os.replace(temporary, segment_path(path, number))
+
+def remove_segments(path, numbers):
+    for number in numbers:
+        try:
+            os.remove(segment_path(path, number))
+        except FileNotFoundError:
+            pass
+
+def auction_diffs(values, bid_count):
+    """
+    Differenza tra ogni valore e il precedente della stessa asta (NaN per la prima offerta di ogni asta).
+    """
+    diffs = np.diff(values, prepend=np.nan)
+    starts = np.cumsum(bid_count) - bid_count
+    diffs[starts[bid_count > 0]] = np.nan
+    return diffs
+
+def auction_means(values, bid_count):
+    """
+    Media per asta dei valori delle sue offerte, NaN esclusi (NaN per le aste senza valori).
+    """
+    auctions = np.repeat(np.arange(len(bid_count)), bid_count)
+    valid = ~np.isnan(values)
+    sums = np.bincount(auctions[valid], weights=values[valid], minlength=len(bid_count))
+    counts = np.bincount(auctions[valid], minlength=len(bid_count))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+def auction_series(columns, metric):
+    """
+    Valore di una metrica per ogni asta conclusa, nell'ordine di chiusura.
+    """
+    if metric == "winning_bid":
+        return columns["winning_bid"]
+    if metric == "bids_per_auction":
+        return columns["bid_count"].astype("float64")
+    # bid_increment: aumento medio tra un'offerta e la precedente della stessa asta
+    return auction_means(auction_diffs(columns["bid_value"], columns["bid_count"]), columns["bid_count"])
+
+METRICS = ("winning_bid", "bids_per_auction", "bid_increment")
+
+def values_list(values):
+    # JSON non ammette NaN né infiniti
+    return [float(value) if np.isfinite(value) else None for value in values]
+
+def downsample(x, values, points):
+    """
+    Riduce una serie a points intervalli consecutivi di (quasi) uguale ampiezza, restituendo per ognuno il primo x
+    e media, minimo e massimo dei valori (NaN esclusi). Una serie più corta resta com'è.
+    """
+    if len(values) <= points:
+        series = values_list(values)
+        return {"x": x.tolist(), "mean": series, "min": series, "max": series}
+
+    starts = np.arange(points) * len(values) // points
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0), starts)
+    counts = np.add.reduceat(valid.astype("int64"), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return {
+        "x": x[starts].tolist(),
+        "mean": values_list(means),
+        "min": values_list(np.minimum.reduceat(np.where(valid, values, np.inf), starts)),
+        "max": values_list(np.maximum.reduceat(np.where(valid, values, -np.inf), starts))
+    }
+
+def metric_series(columns, metric, points):
+    values = auction_series(columns, metric)
+    return dict(metric=metric, count=len(values), **downsample(columns["auction_id"], values, points))
+
+def sender_win_rates(columns, limit):
+    """
+    Per ogni mittente: aste a cui ha partecipato, aste vinte e tasso di vittoria; prima chi ha vinto di più.
+    """
+    # Una chiave intera per ogni coppia (asta, mittente): le coppie distinte sono le partecipazioni
+    senders, sender_index = np.unique(columns["bid_sender_id"], return_inverse=True)
+    auction_index = np.repeat(np.arange(len(columns["bid_count"])), columns["bid_count"])
+    pairs = np.unique(auction_index * len(senders) + sender_index)
+    auctions = np.bincount(pairs % max(len(senders), 1), minlength=len(senders))
+    winners, won = np.unique(columns["winner_id"][columns["bid_count"] > 0], return_counts=True)
+
+    wins = np.zeros(len(senders), dtype="int64")
+    positions = np.searchsorted(senders, winners)
+    matched = positions < len(senders)
+    matched[matched] = senders[positions[matched]] == winners[matched]
+    wins[positions[matched]] = won[matched]
+
+    rates = wins / np.maximum(auctions, 1)
+    order = np.lexsort((-rates, -wins))[:limit]
+    return {
+        "total_senders": len(senders),
+        "senders": [
+            {"sender_id": int(senders[i]), "auctions": int(auctions[i]), "wins": int(wins[i]), "win_rate": float(rates[i])}
+            for i in order
+        ]
+    }
+
+def inter_arrival(columns):
+    """
+    Percentili (in secondi) del tempo tra un'offerta e la precedente della stessa asta.
+    Le offerte arrivate nella stessa richiesta (es. /receive-data/batch) hanno lo stesso received_at:
+    il tempo tra di loro non è noto e non viene contato.
+    """
+    gaps = auction_diffs(columns["bid_received_at"], columns["bid_count"])
+    gaps = gaps[gaps > 0]  # Esclude anche i NaN
+    if not gaps.size:
+        return {"count": 0, "mean": None, **{f"p{p}": None for p in INTER_ARRIVAL_PERCENTILES}}
+    percentiles = np.percentile(gaps, INTER_ARRIVAL_PERCENTILES)
+    return {
+        "count": int(gaps.size),
+        "mean": float(gaps.mean()),
+        **{f"p{p}": float(value) for p, value in zip(INTER_ARRIVAL_PERCENTILES, percentiles)}
+    }
+
+class BidAnalytics:
+    """
+    Analisi delle offerte delle aste concluse, calcolate con operazioni vettoriali di NumPy.
+    Le offerte sono tenute per colonne (un array per campo) in memoria e su file: alla chiusura di un'asta le sue
+    colonne vanno in un nuovo file npz della cartella, senza riscrivere gli altri (oltre ANALYTICS_MAX_SEGMENTS file
+    la cache viene compattata in uno solo). Al primo uso la cache viene confrontata con le aste concluse del backend:
+    quelle mancanti o con offerta vincente e numero di offerte diversi vengono rilette. Con un backend solo in memoria
+    la cache non va su file, perché al riavvio descriverebbe aste che non esistono più.
+    I risultati restano in memoria fino all'aggiunta successiva.
+    """
+
+    def __init__(self, storage, path=ANALYTICS_PATH):
+        self.storage = storage
+        self.path = path
+        self.columns = None   # None: cache non ancora caricata
+        self.fingerprint = None
+        self.segments = []    # Numeri dei file della cache nella cartella
+        self.ended = []       # Aste concluse non ancora aggiunte
+        self.results = {}     # Risultati già calcolati sulle colonne attuali
+        self.lock = asyncio.Lock()
+        self.updater = None
+
+    def auction_ended(self, auction_id):
+        """
+        Chiamata alla chiusura di un'asta: le sue colonne vengono aggiunte in background.
+        """
+        if np is None:
+            return
+        self.ended.append(auction_id)
+        if self.updater is None or self.updater.done():
+            self.updater = asyncio.get_running_loop().create_task(self.update_in_background())
+
+    async def update_in_background(self):
+        try:
+            await self.update()
+        except Exception as e:
+            logger.error("analytics_update_failed", error=str(e))
+
+    async def update(self):
+        async with self.lock:
+            if self.columns is None:
+                await self.load()
+            if self.ended:
+                auction_ids, self.ended = self.ended, []
+                documents = [await self.storage.read_auction(auction_id) for auction_id in auction_ids]
+                await self.extend([document for document in documents if document and not document["is_active"]])
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        self.fingerprint = await self.storage.fingerprint()
+        if self.fingerprint is None:
+            self.path = None
+        columns, self.segments, clean = await loop.run_in_executor(None, read_columns, self.path, self.fingerprint)
+
+        # Aste concluse nel backend (solo i riepiloghi, senza storico), in ordine di auction_id
+        summaries = []
+        after_id = None
+        while True:
+            page = await self.storage.find_auctions("summary", after_id, MAX_AUCTIONS_PAGE)
+            if not page:
+                break
+            summaries.extend(auction for auction in page if not auction["is_active"])
+            after_id = page[-1]["auction_id"]
+        ended_ids = np.array([auction["auction_id"] for auction in summaries], dtype=COLUMNS["auction_id"])
+        winning_bids = np.array([auction["highest_bid"] for auction in summaries], dtype=COLUMNS["winning_bid"])
+        bid_counts = np.array([auction["bid_count"] for auction in summaries], dtype=COLUMNS["bid_count"])
+
+        # Restano le aste che il backend ha ancora con la stessa offerta vincente e lo stesso numero di offerte;
+        # le altre (es. cache di un altro database o scritta prima di una modifica) vengono rilette
+        positions = np.minimum(np.searchsorted(ended_ids, columns["auction_id"]), max(len(ended_ids) - 1, 0))
+        keep = np.zeros(len(columns["auction_id"]), dtype=bool)
+        if len(ended_ids):
+            keep = ((ended_ids[positions] == columns["auction_id"])
+                    & (winning_bids[positions] == columns["winning_bid"])
+                    & (bid_counts[positions] == columns["bid_count"]))
+        changed = not clean or not keep.all()
+        if not keep.all():
+            columns = select_auctions(columns, keep)
+        self.columns = columns
+        missing = np.setdiff1d(ended_ids, columns["auction_id"])
+        if not missing.size:
+            if changed:
+                await self.save()
+            return
+
+        logger.info("analytics_rebuilding", cached=len(columns["auction_id"]), missing=len(missing))
+        missing_ids = set(missing.tolist())
+        documents = []
+        after_id = int(missing[0]) - 1
+        while True:
+            page = await self.storage.find_auctions("full", after_id, MAX_AUCTIONS_PAGE)
+            if not page:
+                break
+            documents.extend(auction for auction in page if not auction["is_active"] and auction["auction_id"] in missing_ids)
+            after_id = page[-1]["auction_id"]
+        await self.extend(documents, compact=changed)
+
+    async def extend(self, documents, compact=False):
+        """
+        Aggiunge alla cache le colonne delle aste concluse non ancora presenti e le salva in un nuovo file
+        (con compact la cache viene riscritta in un file solo).
+        """
+        present = set(self.columns["auction_id"].tolist())
+        documents = [document for document in documents if document["auction_id"] not in present]
+        new_columns = None
+        if documents:
+            new_columns = auction_columns(documents)
+            self.columns = concatenate_columns([self.columns, new_columns])
+            self.results = {}
+        if new_columns is not None or compact:
+            await self.save(None if compact else new_columns)
+
+    async def save(self, new_columns=None):
+        """
+        Scrive new_columns in un nuovo file della cartella; senza new_columns, o oltre ANALYTICS_MAX_SEGMENTS file,
+        scrive tutta la cache in un file solo e poi toglie i precedenti.
+        """
+        if not self.path:
+            return
+        loop = asyncio.get_running_loop()
+        number = self.segments[-1] + 1 if self.segments else 0
+        if new_columns is not None and len(self.segments) < ANALYTICS_MAX_SEGMENTS:
+            await loop.run_in_executor(None, write_segment, self.path, number, new_columns, self.fingerprint)
+            self.segments.append(number)
+            return
+        await loop.run_in_executor(None, write_segment, self.path, number, self.columns, self.fingerprint)
+        await loop.run_in_executor(None, remove_segments, self.path, self.segments)
+        self.segments = [number]
+
+    async def compute(self, function, *args):
+        """
+        Risultato di function sulle colonne aggiornate, calcolato nel pool di thread e tenuto in memoria.
+        """
+        require_numpy()
+        await self.update()
+        key = (function.__name__,) + args
+        columns = self.columns
+        if key not in self.results:
+            result = await asyncio.get_running_loop().run_in_executor(None, function, columns, *args)
+            if self.columns is not columns:
+                return result  # Colonne cambiate durante il calcolo: il risultato non va in cache
+            self.results[key] = result
+        return self.results[key]
+
+    async def series(self, metric, points=SERIES_POINTS):
+        return await self.compute(metric_series, metric, max(1, min(points, MAX_SERIES_POINTS)))
+
+    async def senders(self, limit=SENDERS_LIMIT):
+        return await self.compute(sender_win_rates, max(1, limit))
+
+    async def inter_arrival(self):
+        return await self.compute(inter_arrival)
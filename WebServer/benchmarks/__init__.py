@@ -0,0 +1,4 @@
+"""
+Benchmark delle app del server (ingest e letture) con MongoDB in processo (mongomock) o locale.
+Uso: python -m benchmarks --help (dalla cartella WebServer).
+"""
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+STORAGES = ("memory", "write_through", "persist_on_end")
+
+# Baseline salvate insieme al codice, una per backend di persistenza
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark di ingest e letture dell'app con ogni backend di persistenza, con MongoDB in processo o locale."
+    )
+    parser.add_argument("--storage", choices=STORAGES + ("all",), default="all",
+                        help="backend di persistenza dell'app (STORAGE_BACKEND)")
+    parser.add_argument("--backend", choices=("mongomock", "mongod"), default="mongomock",
+                        help="mongomock in processo oppure un mongod locale (MONGO_URI)")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="dimensioni dello storico delle offerte, separate da virgole (es. 1000,10000,100000,1000000)")
+    parser.add_argument("--requests", type=int, default=200, help="richieste massime per scenario")
+    parser.add_argument("--seconds", type=float, default=5.0, help="durata massima di ogni scenario")
+    parser.add_argument("--save", action="store_true", help="salva il risultato come baseline in benchmarks/baselines")
+    parser.add_argument("--output", help="salva il risultato in questo file JSON")
+    parser.add_argument("--compare", action="store_true", help="confronta con la baseline salvata")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="variazione ammessa rispetto alla baseline")
+    return parser.parse_args()
+
+def baseline_path(storage, backend):
+    return os.path.join(BASELINE_DIR, f"{storage}-{backend}.json")
+
+def main():
+    args = parse_args()
+    if args.storage == "all":
+        # Un processo per backend: l'app legge STORAGE_BACKEND e tiene il proprio stato a livello di modulo
+        failed = False
+        for storage in STORAGES:
+            print(f"== {storage}")
+            command = [sys.executable, "-m", "benchmarks"] + [
+                argument if argument != "all" else storage for argument in sys.argv[1:]
+            ]
+            if "--storage" not in sys.argv:
+                command += ["--storage", storage]
+            failed |= subprocess.run(command, cwd=os.path.dirname(os.path.dirname(BASELINE_DIR))).returncode != 0
+        sys.exit(1 if failed else 0)
+
+    from .runner import Benchmark, compare
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = Benchmark(args.storage, args.backend, args.requests, args.seconds).run(sizes)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.storage, args.backend), "w") as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(baseline_path(args.storage, args.backend)) as baseline:
+            regressions = compare(report, json.load(baseline), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} scenarios slower than the baseline")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
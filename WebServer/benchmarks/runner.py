@@ -0,0 +1,225 @@
+import contextlib
+import gc
+import importlib
+import io
+import os
+import platform
+import resource
+import sys
+import time
+from simulator.metrics import percentile
+
+try:
+    import msgpack
+except ImportError:  # Senza msgpack lo scenario ingest_order_msgpack viene saltato
+    msgpack = None
+
+# Cartella WebServer: l'app monta static/ e templates/ con percorsi relativi
+WEBSERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Database usato con un mongod locale, ricreato a ogni esecuzione
+BENCHMARK_DB_NAME = "auction_benchmark"
+
+# Offerte per richiesta quando lo storico viene riempito con /receive-data/batch
+SEED_CHUNK = 1000
+
+def use_backend(backend):
+    """
+    Prepara MongoDB prima di importare l'app: "mongomock" (in processo) oppure "mongod" (locale, MONGO_URI).
+    Con STORAGE_BACKEND=memory l'app non si collega, ma la preparazione non costa nulla.
+    La cache delle analisi resta in memoria: i file di WebServer/analytics sono quelli del database reale.
+    """
+    os.environ["ANALYTICS_PATH"] = ""
+    if backend == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            raise RuntimeError("the mongomock backend requires mongomock (pip install mongomock)")
+        import pymongo
+        client = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *args, **kwargs: client
+    else:
+        import pymongo
+        os.environ["MONGO_DB_NAME"] = BENCHMARK_DB_NAME
+        pymongo.MongoClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017/")).drop_database(BENCHMARK_DB_NAME)
+
+def memory_mb():
+    """
+    Memoria residente del processo (RSS) in MB; se /proc non c'è, il picco riportato da getrusage.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return round(int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except OSError:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def order(sequence_number, sender_id=1):
+    return {
+        "bid": sequence_number + 1,
+        "highest_bid": sequence_number + 1,
+        "message_id": sequence_number + 1,
+        "sender_id": sender_id,
+        "winner_id": sender_id,
+        "sequence_number": sequence_number,
+        "message_type": "order"
+    }
+
+def control(message_type):
+    return {"bid": 0, "highest_bid": 0, "message_id": 0, "sender_id": 0, "winner_id": -1, "sequence_number": 0, "message_type": message_type}
+
+class Benchmark:
+    """
+    Esegue gli scenari sull'app con uno dei backend di persistenza (memory, write_through, persist_on_end)
+    e un client in processo. I log a schermo vengono scartati, ma il loro costo resta nelle misure.
+    """
+
+    def __init__(self, storage, backend="mongomock", requests=200, seconds=5.0):
+        self.storage = storage
+        self.backend = backend
+        self.requests = requests
+        self.seconds = seconds
+        self.results = []
+        self.bids = 0
+        self.size = 0  # Dimensione dello storico richiesta per gli scenari in corso
+
+        use_backend(backend)
+        os.environ["STORAGE_BACKEND"] = storage
+        os.chdir(WEBSERVER_DIR)
+        if WEBSERVER_DIR not in sys.path:
+            sys.path.insert(0, WEBSERVER_DIR)
+        from fastapi.testclient import TestClient
+        with self.quiet():
+            self.module = importlib.import_module("main")
+            self.client = TestClient(self.module.app)
+            # Esegue il lifespan dell'app (connessione, contatori, indici)
+            self.client.__enter__()
+
+    def quiet(self):
+        return contextlib.redirect_stdout(io.StringIO())
+
+    def call(self, method, path, **kwargs):
+        with self.quiet():
+            response = self.client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+    def measure(self, scenario, make_request):
+        """
+        Ripete make_request fino a self.requests volte o per self.seconds secondi (almeno 3 volte).
+        """
+        gc.collect()
+        history = self.bids
+        latencies = []
+        started = time.perf_counter()
+        while len(latencies) < self.requests and (len(latencies) < 3 or time.perf_counter() - started < self.seconds):
+            request_started = time.perf_counter()
+            make_request(len(latencies))
+            latencies.append(time.perf_counter() - request_started)
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        result = {
+            "scenario": scenario,
+            "size": self.size,
+            "history": history,
+            "requests": len(latencies),
+            "req_per_s": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "rss_mb": memory_mb()
+        }
+        self.results.append(result)
+        print(f"{scenario:<24} history {history:>8}  {result['req_per_s']:>9} req/s  "
+              f"p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  rss {result['rss_mb']} MB")
+        return result
+
+    def seed(self, count):
+        """
+        Porta lo storico dell'asta attiva a count offerte, a blocchi con /receive-data/batch.
+        """
+        while self.bids < count:
+            chunk = min(SEED_CHUNK, count - self.bids)
+            self.call("POST", "/receive-data/batch", json=[order(self.bids + index) for index in range(chunk)])
+            self.bids += chunk
+
+    def ingest_orders(self):
+        def send(index):
+            self.call("POST", "/receive-data", json=order(self.bids))
+            self.bids += 1
+
+        def send_compact(index):
+            self.call("POST", "/receive-data", json=order(self.bids), params={"ack": "compact"})
+            self.bids += 1
+
+        def send_msgpack(index):
+            self.call("POST", "/receive-data", content=msgpack.packb(order(self.bids)), params={"ack": "compact"},
+                      headers={"content-type": "application/msgpack"})
+            self.bids += 1
+
+        self.measure("ingest_order", send)
+        self.measure("ingest_order_compact", send_compact)
+        if msgpack is not None:
+            self.measure("ingest_order_msgpack", send_msgpack)
+
+    def reads(self):
+        self.measure("auction_state", lambda index: self.call("GET", "/auction_state"))
+        self.measure("bids_history", lambda index: self.call("GET", "/bids_history"))
+        self.measure("bids_history_cursor", lambda index: self.call(
+            "GET", "/bids_history", params={"since_sequence": max(self.bids - 101, 0), "limit": 100}
+        ))
+        self.measure("all_auctions", lambda index: self.call("GET", "/all_auctions"))
+        self.measure("all_auctions_summary", lambda index: self.call(
+            "GET", "/all_auctions", params={"fields": "summary", "limit": 100}
+        ))
+        self.measure("auction_stats", lambda index: self.call("GET", "/auction_stats"))
+
+    def ingest_mix(self, orders_per_auction=20):
+        """
+        Aste complete: start, orders_per_auction offerte, end. Ogni richiesta è un messaggio.
+        """
+        messages = [control("start")] + [order(index) for index in range(orders_per_auction)] + [control("end")]
+        self.measure("ingest_mix", lambda index: self.call("POST", "/receive-data", json=messages[index % len(messages)]))
+
+    def run(self, sizes):
+        self.call("POST", "/receive-data", json=control("start"))
+        for size in sorted(sizes):
+            self.size = size
+            self.seed(size)
+            self.ingest_orders()
+            self.reads()
+        self.call("POST", "/receive-data", json=control("end"))
+        self.ingest_mix()
+        with self.quiet():
+            self.client.__exit__(None, None, None)
+        return self.report()
+
+    def report(self):
+        return {
+            "storage": self.storage,
+            "backend": self.backend,
+            "bid_storage": os.environ.get("BID_STORAGE", "embedded"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": self.results
+        }
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Confronta con una baseline salvata: regressione se req/s cala o p50 cresce oltre la tolleranza.
+    Restituisce la lista delle regressioni.
+    """
+    previous = {(result["scenario"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get((result["scenario"], result["size"]))
+        if old is None:
+            continue
+        ratio = result["req_per_s"] / old["req_per_s"] if old["req_per_s"] else 1.0
+        slower = result["req_per_s"] < old["req_per_s"] * (1 - tolerance) or result["p50_ms"] > old["p50_ms"] * (1 + tolerance)
+        print(f"{result['scenario']:<24} size {result['size']:>8}  {ratio:>6.2f}x req/s"
+              + ("  REGRESSION" if slower else ""))
+        if slower:
+            regressions.append(result)
+    return regressions
@@ -0,0 +1,233 @@
+from bisect import bisect_right
+from db import BID_STORAGE, auction_collection, bids_collection
+from eventlog import insert_events, order_events, replace_events
+
+# Numero massimo di offerte restituite da una singola lettura paginata
+MAX_BIDS_PAGE = 1000
+
+def slice_bid_history(bid_history, since_sequence=None, limit=None):
+    """
+    Restituisce le offerte con sequence_number maggiore di since_sequence, al massimo limit.
+    bid_history è ordinata per sequence_number, quindi il punto di partenza si trova con una ricerca binaria.
+    """
+    start = 0
+    if since_sequence is not None:
+        start = bisect_right(bid_history, since_sequence, key=lambda bid: bid["sequence_number"])
+    if limit is None:
+        return bid_history[start:]
+    return bid_history[start:start + min(limit, MAX_BIDS_PAGE)]
+
+def bid_history_pipeline(since_sequence=None, limit=None, query=None):
+    """
+    Pipeline di aggregazione che estrae dall'asta cercata (predefinita: quella attiva)
+    solo le offerte successive a since_sequence.
+    """
+    bid_history = "$bid_history"
+    if since_sequence is not None:
+        bid_history = {"$filter": {
+            "input": "$bid_history",
+            "as": "bid",
+            "cond": {"$gt": ["$$bid.sequence_number", since_sequence]}
+        }}
+    if limit is not None:
+        bid_history = {"$slice": [bid_history, min(limit, MAX_BIDS_PAGE)]}
+    return [
+        {"$match": query or {"is_active": True}},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "bid_history": bid_history}}
+    ]
+
+# Le funzioni seguenti sono chiamate bloccanti, da eseguire nel pool di thread
+
+def bid_fields(bids):
+    """
+    Campi con le offerte da salvare nel documento di un'asta, secondo la modalità configurata.
+    """
+    if BID_STORAGE == "collection":
+        return {"bid_count": len(bids)}
+    return {"bid_history": bids}
+
+def insert_bids(auction_id, bids):
+    """
+    Salva le offerte nella collezione bids (solo in modalità "collection").
+    """
+    if BID_STORAGE == "collection" and bids:
+        return bids_collection.insert_many([dict(bid, auction_id=auction_id) for bid in bids]).inserted_ids
+    return []
+
+class SequenceConflict(Exception):
+    """
+    I sequence_number di un lotto di offerte sono già usati da offerte diverse (contatori in memoria non aggiornati).
+    """
+
+def bid_keys(bids):
+    return [(bid["sequence_number"], bid["sender_id"], bid["message_id"]) for bid in bids]
+
+def store_bids(auction_id, new_bids, fields):
+    """
+    Registra nuove offerte di un'asta, con i loro eventi order, e aggiorna i campi riassuntivi del suo documento.
+    L'aggiornamento del documento conclude la scrittura e vale solo se l'ultima offerta salvata precede il lotto.
+    Ripetere lo stesso lotto non ha effetto; un lotto diverso con sequence_number già salvati solleva SequenceConflict.
+    """
+    first, last = new_bids[0]["sequence_number"], new_bids[-1]["sequence_number"]
+    taken = insert_events(order_events(auction_id, new_bids))
+    if taken:
+        # Eventi già presenti con questi sequence_number: di offerte salvate (nuovo tentativo dello stesso lotto
+        # o conflitto) oppure lasciati da un tentativo fallito prima dell'aggiornamento del documento
+        stored = auction_collection.find_one({"auction_id": auction_id}, {"_id": 0, "sequence_number": 1})
+        if stored is not None and stored["sequence_number"] >= first:
+            check_stored_bids(auction_id, new_bids)
+            return
+        replace_events(taken)
+        if BID_STORAGE == "collection":
+            bids_collection.delete_many({"auction_id": auction_id, "sequence_number": {"$gte": first, "$lte": last}})
+
+    inserted = []
+    if BID_STORAGE == "collection":
+        inserted = insert_bids(auction_id, new_bids)
+        update = {"$set": fields, "$inc": {"bid_count": len(new_bids)}}
+    else:
+        update = {"$set": fields, "$push": {"bid_history": {"$each": new_bids}}}
+    result = auction_collection.update_one({"auction_id": auction_id, "sequence_number": first - 1}, update)
+    if not result.matched_count:
+        if inserted:
+            bids_collection.delete_many({"_id": {"$in": inserted}})
+        check_stored_bids(auction_id, new_bids)
+
+def check_stored_bids(auction_id, new_bids):
+    """
+    Solleva SequenceConflict se le offerte salvate con i sequence_number del lotto non sono le stesse (mittente e message_id).
+    """
+    first, last = new_bids[0]["sequence_number"], new_bids[-1]["sequence_number"]
+    stored = load_active_bid_history(first - 1, None, {"auction_id": auction_id}) or []
+    stored = [bid for bid in stored if bid["sequence_number"] <= last]
+    if bid_keys(stored) != bid_keys(new_bids):
+        raise SequenceConflict(f"sequence_number {first}-{last} of auction {auction_id} already used by other bids")
+
+def replace_bids(auction_id, bids):
+    """
+    Come insert_bids, ma sostituisce le offerte dell'asta già salvate: ripetibile dopo un errore a metà.
+    """
+    if BID_STORAGE == "collection":
+        bids_collection.delete_many({"auction_id": auction_id})
+    insert_bids(auction_id, bids)
+
+def store_bids_once(auction_id, new_bids, fields):
+    """
+    Come store_bids, ma ripetibile: salta le offerte già salvate, confrontando i sequence_number
+    con quello del documento (es. rilettura del journal dopo un crash o nuovo tentativo dopo un errore).
+    """
+    stored = auction_collection.find_one({"auction_id": auction_id}, {"_id": 0, "sequence_number": 1})
+    if stored is None:
+        return
+    new_bids = [bid for bid in new_bids if bid["sequence_number"] > stored["sequence_number"]]
+    if not new_bids:
+        return
+    if BID_STORAGE == "collection":
+        # Offerte inserite da un tentativo interrotto prima dell'aggiornamento del documento
+        bids_collection.delete_many({"auction_id": auction_id, "sequence_number": {"$gt": stored["sequence_number"]}})
+    store_bids(auction_id, new_bids, fields)
+
+def load_message_watermarks(auction_id):
+    """
+    message_id più alto registrato da ogni mittente in un'asta, per ricostruire il filtro dei duplicati dopo un riavvio.
+    """
+    group = {"$group": {"_id": "$sender_id", "message_id": {"$max": "$message_id"}}}
+    if BID_STORAGE == "collection":
+        rows = bids_collection.aggregate([{"$match": {"auction_id": auction_id}}, group])
+    else:
+        rows = auction_collection.aggregate([
+            {"$match": {"auction_id": auction_id}},
+            {"$unwind": "$bid_history"},
+            {"$replaceRoot": {"newRoot": "$bid_history"}},
+            group
+        ])
+    return {row["_id"]: row["message_id"] for row in rows if row["message_id"]}
+
+def read_bid_history(auction_id, since_sequence=None, limit=None):
+    """
+    Legge dalla collezione bids le offerte di un'asta in ordine di sequence_number.
+    """
+    query = {"auction_id": auction_id}
+    if since_sequence is not None:
+        query["sequence_number"] = {"$gt": since_sequence}
+    cursor = bids_collection.find(query, {"_id": 0, "auction_id": 0}).sort("sequence_number", 1)
+    if limit is not None:
+        cursor = cursor.limit(min(limit, MAX_BIDS_PAGE))
+    return list(cursor)
+
+def load_active_bid_history(since_sequence=None, limit=None, query=None):
+    """
+    Restituisce le offerte dell'asta cercata (predefinita: quella attiva) successive al cursore,
+    oppure None se l'asta non esiste.
+    """
+    query = query or {"is_active": True}
+    if BID_STORAGE == "collection":
+        auction = auction_collection.find_one(query, {"_id": 0, "auction_id": 1})
+        if not auction:
+            return None
+        return read_bid_history(auction["auction_id"], since_sequence, limit)
+
+    auctions = list(auction_collection.aggregate(bid_history_pipeline(since_sequence, limit, query)))
+    return auctions[0].get("bid_history", []) if auctions else None
+
+def with_bid_history(auction):
+    """
+    Aggiunge al documento di un'asta lo storico delle offerte, se è salvato a parte.
+    """
+    if auction and BID_STORAGE == "collection":
+        auction["bid_history"] = read_bid_history(auction["auction_id"])
+    return auction
+
+def load_all_auctions():
+    """
+    Restituisce tutte le aste con il loro storico delle offerte.
+    """
+    if BID_STORAGE == "collection":
+        return list(auction_collection.aggregate([
+            {"$lookup": {
+                "from": bids_collection.name,
+                "let": {"auction_id": "$auction_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$auction_id", "$$auction_id"]}}},
+                    {"$sort": {"sequence_number": 1}},
+                    {"$project": {"_id": 0, "auction_id": 0}}
+                ],
+                "as": "bid_history"
+            }},
+            {"$project": {"_id": 0}}
+        ]))
+    return list(auction_collection.find({}, {"_id": 0}))
+
+# Dimensione predefinita e massima di una pagina di aste
+AUCTIONS_PAGE = 100
+MAX_AUCTIONS_PAGE = 1000
+
+# Campi restituiti con fields=summary: niente storico, solo il numero di offerte
+SUMMARY_PROJECTION = {
+    "_id": 0,
+    "auction_id": 1,
+    "is_active": 1,
+    "highest_bid": 1,
+    "winner_id": 1,
+    "sequence_number": 1,
+    "bid_count": {"$ifNull": ["$bid_count", {"$size": {"$ifNull": ["$bid_history", []]}}]}
+}
+
+def find_auctions(fields="full", after_id=None, limit=AUCTIONS_PAGE):
+    """
+    Restituisce una pagina di aste ordinate per auction_id, a partire da quella successiva ad after_id.
+    Con fields="summary" le aste non contengono lo storico delle offerte.
+    """
+    pipeline = []
+    if after_id is not None:
+        pipeline.append({"$match": {"auction_id": {"$gt": after_id}}})
+    pipeline.append({"$sort": {"auction_id": 1}})
+    pipeline.append({"$limit": min(limit, MAX_AUCTIONS_PAGE)})
+
+    if fields == "summary":
+        pipeline.append({"$project": SUMMARY_PROJECTION})
+        return list(auction_collection.aggregate(pipeline))
+
+    pipeline.append({"$project": {"_id": 0}})
+    return [with_bid_history(auction) for auction in auction_collection.aggregate(pipeline)]
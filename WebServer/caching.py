@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import os
+from urllib.parse import parse_qs
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from wire import respond
+
+try:
+    import brotli
+except ImportError:  # Senza brotli i file statici vengono compressi solo con gzip
+    brotli = None
+
+# File statici richiesti con ?v=<hash del contenuto> (l'URL cambia a ogni modifica): in cache per un anno
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Tutto il resto: il client può tenerlo, ma lo riconvalida ogni volta con ETag/If-None-Match
+REVALIDATE = "no-cache"
+# Sotto questa dimensione la compressione non conviene
+MIN_COMPRESS_SIZE = 256
+
+def auction_etag(auction):
+    """
+    Versione dell'asta: cambia a ogni offerta registrata e alla chiusura.
+    """
+    sequence_number = max(auction.stored["sequence_number"], len(auction.state["bid_history"]))
+    lifecycle = "active" if auction.state["is_active"] else "ended"
+    return f'W/"{auction.auction_id}-{lifecycle}-{sequence_number}"'
+
+def is_fresh(request, etag):
+    """
+    True se il client ha già questa versione (If-None-Match, confronto debole).
+    """
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE, "Vary": "Accept"})
+
+def versioned(request, content, etag):
+    """
+    Risposta con la versione dell'asta, che il client rimanda in If-None-Match alla lettura successiva.
+    """
+    response = respond(request, content)
+    if etag is not None:
+        response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE
+    response.headers["Vary"] = "Accept"
+    return response
+
+def accepted_encodings(header):
+    encodings = set()
+    for item in header.split(","):
+        name, _, parameters = item.partition(";")
+        quality = parameters.strip().replace(" ", "")
+        if quality.startswith("q=") and not quality[2:].strip("0."):
+            continue  # q=0: codifica rifiutata
+        encodings.add(name.strip().lower())
+    return encodings
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles con intestazioni di cache e versioni compresse (brotli, gzip) dei file.
+    Le versioni compresse sono calcolate all'avvio e tenute in memoria; un file modificato viene ricompresso.
+    url() restituisce l'URL con l'hash del contenuto, che il browser può tenere in cache per un anno.
+    """
+
+    def __init__(self, *, directory, mount_path="/static", **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.mount_path = mount_path
+        self.variants = {}  # percorso completo -> ((mtime, dimensione), hash, {codifica: contenuto})
+        for root, _, names in os.walk(directory):
+            for name in names:
+                self.load(os.path.join(root, name))
+
+    def load(self, full_path, stat_result=None):
+        stat_result = stat_result or os.stat(full_path)
+        key = (stat_result.st_mtime_ns, stat_result.st_size)
+        entry = self.variants.get(full_path)
+        if entry is not None and entry[0] == key:
+            return entry
+
+        with open(full_path, "rb") as static_file:
+            content = static_file.read()
+        encodings = {}
+        if len(content) >= MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                encodings["br"] = brotli.compress(content)
+            encodings["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+        entry = self.variants[full_path] = (key, hashlib.sha1(content).hexdigest()[:12], encodings)
+        return entry
+
+    def url(self, path):
+        """
+        URL di un file statico con la versione del contenuto, da usare nei template: {{ static_url('js/stats.js') }}.
+        """
+        return f"{self.mount_path}/{path}?v={self.load(os.path.join(self.directory, path))[1]}"
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        _, content_hash, encodings = self.load(full_path, stat_result)
+        # Immutabile solo se la versione nell'URL è quella del contenuto attuale
+        version = parse_qs(scope.get("query_string", b"").decode()).get("v")
+        cache_control = IMMUTABLE if version == [content_hash] else REVALIDATE
+        request_headers = Headers(scope=scope)
+
+        if response.status_code == 200 and scope["method"] == "GET" and encodings and "range" not in request_headers:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            encoding = next((name for name in ("br", "gzip") if name in accepted and name in encodings), None)
+            if encoding is not None:
+                # Ogni codifica ha il suo ETag, altrimenti una cache potrebbe confonderle
+                etag = response.headers["etag"][:-1] + f'-{encoding}"'
+                headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+                if etag in [tag.strip() for tag in request_headers.get("if-none-match", "").split(",")]:
+                    return Response(status_code=304, headers=headers)
+                headers.update({"Content-Encoding": encoding, "Last-Modified": response.headers["last-modified"]})
+                return Response(encodings[encoding], headers=headers, media_type=response.headers["content-type"])
+
+        response.headers["Cache-Control"] = cache_control
+        if encodings:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
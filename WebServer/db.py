@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from metrics import mongo_duration, mongo_errors, mongo_in_flight, mongo_wait
+
+# Configurazione della connessione a MongoDB (sovrascrivibile da variabili d'ambiente)
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "auction_db")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# Dove salvare le offerte: "embedded" (array bid_history nel documento dell'asta)
+# oppure "collection" (un documento per offerta nella collezione bids)
+BID_STORAGE = os.environ.get("BID_STORAGE", "embedded")
+
+# Connessione a MongoDB, aperta da connect() al primo utilizzo (di solito nel lifespan dell'app)
+client = None
+database = None
+connect_lock = threading.Lock()
+
+def connect():
+    """
+    Apre la connessione con pool di connessioni esplicito, una sola volta per processo.
+    """
+    global client, database
+    with connect_lock:
+        if database is None:
+            client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS
+            )
+            database = client[MONGO_DB_NAME]
+    return database
+
+def close():
+    global client, database
+    with connect_lock:
+        if client is not None:
+            client.close()
+        client = database = None
+
+class LazyCollection:
+    """
+    Collezione che apre la connessione solo quando viene usata: importare i moduli non contatta MongoDB,
+    e un'app che non usa MongoDB (STORAGE_BACKEND=memory) non si collega mai.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(connect()[self.name], attribute)
+
+auction_collection = LazyCollection("auctions")
+counter_collection = LazyCollection("counters")
+stats_collection = LazyCollection("stats")
+bids_collection = LazyCollection("bids")
+events_collection = LazyCollection("events")
+snapshots_collection = LazyCollection("snapshots")
+
+# Pool di thread limitato per le chiamate bloccanti di pymongo:
+# non ha senso avere più thread che connessioni disponibili nel pool
+db_executor = ThreadPoolExecutor(max_workers=MONGO_MAX_POOL_SIZE, thread_name_prefix="mongo")
+
+async def run_db(function, *args, **kwargs):
+    """
+    Esegue una chiamata bloccante a MongoDB nel pool di thread,
+    così l'event loop di uvicorn resta libero di servire altre richieste.
+    """
+    loop = asyncio.get_running_loop()
+    operation = operation_name(function)
+    mongo_in_flight.inc()
+    submitted = time.perf_counter()
+    try:
+        result, started, finished = await loop.run_in_executor(db_executor, partial(timed_call, function, *args, **kwargs))
+    except Exception:
+        mongo_errors.inc(operation)
+        raise
+    finally:
+        mongo_in_flight.dec()
+    # Le metriche vengono aggiornate qui, nel thread dell'event loop
+    mongo_wait.observe(started - submitted, operation)
+    mongo_duration.observe(finished - started, operation)
+    return result
+
+def timed_call(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, started, time.perf_counter()
+
+def operation_name(function):
+    """
+    Nome dell'operazione per le metriche: collezione.metodo (es. auctions.update_one) o nome della funzione.
+    """
+    collection = getattr(function, "__self__", None)
+    if collection is not None and hasattr(collection, "name"):
+        return f"{collection.name}.{function.__name__}"
+    return getattr(function, "__name__", "unknown")
+
+def database_fingerprint():
+    """
+    Impronta del database, per riconoscere i file scritti per un altro database: un id casuale salvato
+    una sola volta nella collezione counters. A differenza di URI e nome, distingue anche un database
+    ricreato o uno in processo (mongomock) con la stessa configurazione.
+    """
+    try:
+        document = counter_collection.find_one_and_update(
+            {"_id": "database_id"},
+            {"$setOnInsert": {"value": uuid.uuid4().hex[:16]}},
+            upsert=True,
+            return_document=True
+        )
+    except DuplicateKeyError:
+        # Un altro processo lo ha creato nello stesso momento
+        document = counter_collection.find_one({"_id": "database_id"})
+    return document["value"]
+
+def ensure_counters():
+    """
+    Assicurati che esista un contatore per auction_id.
+    """
+    if not counter_collection.find_one({"_id": "auction_id"}):
+        counter_collection.insert_one({"_id": "auction_id", "sequence_value": 0})
+
+def get_next_sequence_value(sequence_name):
+    """
+    Genera un ID incrementale basato sul nome del contatore.
+    """
+    result = counter_collection.find_one_and_update(
+        {"_id": sequence_name},
+        {"$inc": {"sequence_value": 1}},
+        upsert=True,
+        return_document=True
+    )
+    return result["sequence_value"]
+
+def ensure_unique_auction_id():
+    """
+    Indice unico su auction_id: due "start" con lo stesso id non possono creare due documenti.
+    Un database creato con il vecchio indice non unico viene aggiornato; se contiene già id ripetuti
+    l'indice resta non unico (l'unicità è garantita solo dal processo che scrive).
+    """
+    try:
+        auction_collection.create_index("auction_id", unique=True)
+    except DuplicateKeyError:
+        auction_collection.create_index("auction_id")
+    except OperationFailure:
+        # Esiste già un indice auction_id_1 con opzioni diverse (non unico)
+        auction_collection.drop_index("auction_id_1")
+        try:
+            auction_collection.create_index("auction_id", unique=True)
+        except DuplicateKeyError:
+            auction_collection.create_index("auction_id")
+
+def ensure_indexes():
+    """
+    Crea gli indici usati dal percorso caldo (ricerca per auction_id, dell'asta attiva
+    e delle offerte di un'asta in ordine di sequence_number) e dal log degli eventi.
+    """
+    ensure_unique_auction_id()
+    auction_collection.create_index("is_active")
+    bids_collection.create_index([("auction_id", 1), ("sequence_number", 1)])
+    # Unici: un evento o uno snapshot riscritto (es. dal journal dopo un crash) viene scartato
+    events_collection.create_index([("auction_id", 1), ("sequence_number", 1), ("step", 1)], unique=True)
+    snapshots_collection.create_index([("auction_id", 1), ("sequence_number", 1)], unique=True)
@@ -0,0 +1,71 @@
+import os
+from collections import OrderedDict
+from metrics import duplicate_messages
+
+# message_id fuori ordine ricordati per ogni asta, oltre ai watermark dei mittenti
+DEDUP_WINDOW = int(os.environ.get("DEDUP_WINDOW", "256"))
+
+class MessageDedup:
+    """
+    Messaggi "order" già registrati in un'asta, riconosciuti da (sender_id, message_id).
+    Il firmware numera i messaggi di ogni mittente 1, 2, 3, ...: per ogni mittente basta il watermark,
+    cioè il message_id fino al quale sono arrivati tutti. Gli id arrivati fuori ordine restano in un
+    dizionario limitato a window elementi; quando è pieno esce il più vecchio e il watermark lo raggiunge
+    (il buco sotto di lui viene considerato perso). Ogni controllo costa una ricerca in un dizionario.
+    I messaggi con message_id <= 0 non sono identificabili e non vengono mai scartati.
+    """
+
+    def __init__(self, watermarks=None, window=DEDUP_WINDOW):
+        self.watermarks = dict(watermarks or {})  # sender_id -> message_id
+        self.recent = OrderedDict()               # (sender_id, message_id) sopra il watermark, dal più vecchio
+        self.window = window
+
+    def seen(self, sender_id, message_id):
+        if message_id <= 0:
+            return False
+        return message_id <= self.watermarks.get(sender_id, 0) or (sender_id, message_id) in self.recent
+
+    def mark(self, sender_id, message_id):
+        watermark = self.watermarks.get(sender_id, 0)
+        if message_id <= 0 or message_id <= watermark:
+            return
+        if message_id == watermark + 1:
+            self.advance(sender_id, message_id)
+            return
+        self.recent[(sender_id, message_id)] = None
+        if len(self.recent) > self.window:
+            # Il buco sotto l'id più vecchio non si è chiuso: lo consideriamo perso
+            (old_sender, old_message_id), _ = self.recent.popitem(last=False)
+            for key in [key for key in self.recent if key[0] == old_sender and key[1] < old_message_id]:
+                del self.recent[key]
+            self.advance(old_sender, old_message_id)
+
+    def advance(self, sender_id, message_id):
+        """
+        Porta il watermark del mittente a message_id, poi avanti finché gli id successivi sono già arrivati.
+        """
+        while (sender_id, message_id + 1) in self.recent:
+            message_id += 1
+            del self.recent[(sender_id, message_id)]
+        self.watermarks[sender_id] = message_id
+
+    def fresh(self, messages):
+        """
+        Ordini non ancora registrati, senza ripetizioni anche all'interno dello stesso lotto.
+        Vanno segnati con mark_all solo dopo la scrittura, così un tentativo fallito può essere ripetuto.
+        """
+        keys = set()
+        fresh = []
+        for message in messages:
+            key = (message.sender_id, message.message_id)
+            if self.seen(*key) or (message.message_id > 0 and key in keys):
+                continue
+            keys.add(key)
+            fresh.append(message)
+        if len(fresh) < len(messages):
+            duplicate_messages.inc("order", amount=len(messages) - len(fresh))
+        return fresh
+
+    def mark_all(self, messages):
+        for message in messages:
+            self.mark(message.sender_id, message.message_id)
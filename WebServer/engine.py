@@ -0,0 +1,156 @@
+import asyncio
+from dedup import MessageDedup
+
+def new_auction_state(item=None):
+    """
+    Stato in memoria di un'asta, con la stessa forma del vecchio dizionario globale auction_state.
+    """
+    return {
+        "is_active": False,
+        "highest_bid": 0,
+        "winner_id": -1,
+        "sequence_number": 0,
+        "bid_history": [],
+        "item": item or {}
+    }
+
+class AuctionState:
+    """
+    Una singola asta: stato in memoria, contatori già salvati sul database e lock dedicato.
+    Il lock serializza solo le scritture di questa asta: offerte su aste diverse procedono in parallelo.
+    """
+
+    def __init__(self, auction_id, stored=None):
+        self.auction_id = auction_id
+        self.state = new_auction_state()
+        self.stored = stored or {"highest_bid": 0, "winner_id": -1, "sequence_number": 0}
+        self.lock = asyncio.Lock()
+        self.sequencer = None  # Sequenziatore lato server, se i nodi lo usano (vedi sequencer.py)
+        self.next_sequence_number = 0  # Prossimo sequence_number atteso dai messaggi "order" (None: sconosciuto)
+        self.dedup = MessageDedup()    # Ordini già registrati, per scartare le ritrasmissioni
+        self.start_key = None          # (sender_id, message_id) del messaggio "start" che l'ha avviata
+
+    def has_bids(self):
+        return bool(self.stored["sequence_number"] or self.state["bid_history"])
+
+class AuctionEngine:
+    """
+    Gestisce più aste contemporanee indicizzate per auction_id.
+    I messaggi senza auction_id (il firmware attuale non lo invia) vanno all'asta predefinita,
+    cioè l'ultima avviata senza un auction_id esplicito.
+    Presuppone un solo processo che scrive sulle aste attive.
+    Le aste che non sono in memoria vengono chieste al backend di persistenza (vedi storage.py).
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.auctions = {}
+        self.default_auction_id = None
+        self.starting = {}  # (auction_id del messaggio, start_key) -> Future degli "start" non ancora salvati
+
+    def resolve(self, auction_id=None):
+        return self.default_auction_id if auction_id is None else auction_id
+
+    def is_default(self, auction_id):
+        return auction_id == self.default_auction_id
+
+    def get(self, auction_id=None):
+        return self.auctions.get(self.resolve(auction_id))
+
+    def add(self, auction_id, default=False, stored=None):
+        """
+        Registra una nuova asta. Se diventa la predefinita, quella precedente resta in memoria solo se ancora attiva.
+        """
+        auction = AuctionState(auction_id, stored)
+        if default:
+            self.reset_default()
+            self.default_auction_id = auction_id
+        self.auctions[auction_id] = auction
+        return auction
+
+    def reset_default(self):
+        """
+        Dimentica l'asta predefinita, togliendola dalla memoria se è già conclusa.
+        """
+        previous = self.auctions.get(self.default_auction_id)
+        if previous is not None and not previous.state["is_active"]:
+            del self.auctions[previous.auction_id]
+        self.default_auction_id = None
+
+    def finish(self, auction_id):
+        """
+        Toglie dalla memoria un'asta conclusa; la predefinita resta visibile fino all'avvio della successiva.
+        """
+        if not self.is_default(auction_id):
+            self.auctions.pop(auction_id, None)
+
+    async def get_or_load(self, auction_id=None):
+        """
+        Restituisce l'asta attiva richiesta; se non è in memoria (es. dopo un riavvio) la ricarica dal backend.
+        """
+        auction = self.get(auction_id)
+        if auction is not None and auction.state["is_active"]:
+            return auction
+
+        stored = await self.storage.load_active(self.resolve(auction_id))
+        if not stored:
+            return None
+        stored_id = stored.pop("auction_id")
+        watermarks = stored.pop("watermarks")
+        # Un'altra richiesta potrebbe averla già ricaricata durante l'attesa
+        auction = self.auctions.get(stored_id)
+        if auction is None:
+            auction = self.add(stored_id, stored=stored)
+            auction.dedup = MessageDedup(watermarks)
+            # Dopo un riavvio non sappiamo quale ordine arriverà per primo
+            auction.next_sequence_number = None
+            auction.state.update(is_active=True, highest_bid=stored["highest_bid"], winner_id=stored["winner_id"])
+        if auction_id is None:
+            self.default_auction_id = stored_id
+        return auction
+
+    async def reload(self, auction):
+        """
+        Rilegge dal backend i contatori salvati di un'asta attiva, es. dopo una scrittura fallita che il backend
+        potrebbe aver applicato prima dell'errore. Restituisce quelli letti, oppure None se l'asta non c'è.
+        """
+        stored = await self.storage.load_active(auction.auction_id)
+        if stored:
+            auction.stored.update({field: stored[field] for field in auction.stored})
+        return stored
+
+    def repeated_start(self, auction_id, start_key):
+        """
+        Asta attiva già avviata da questo stesso messaggio "start" (una ritrasmissione), oppure None.
+        Senza auction_id vale solo finché l'asta predefinita non ha offerte: uno "start" uguale arrivato
+        dopo delle offerte avvia una nuova asta (es. il sequenziatore è stato riavviato).
+        """
+        auction = self.get(auction_id)
+        if auction is None or not auction.state["is_active"] or auction.start_key != start_key:
+            return None
+        if auction_id is None and auction.has_bids():
+            return None
+        return auction
+
+    def is_starting(self, auction_id):
+        """
+        True se un altro "start" con questo auction_id esplicito è in corso (l'id è già riservato).
+        """
+        return any(key[0] == auction_id for key in self.starting)
+
+    async def find_ended(self, auction_id=None):
+        """
+        Asta già conclusa a cui si riferisce un "end" ripetuto: in memoria oppure, con auction_id, nel backend.
+        """
+        auction = self.get(auction_id)
+        if auction is not None:
+            return None if auction.state["is_active"] else auction
+        if auction_id is None:
+            return None
+        stored = await self.storage.load_ended(auction_id)
+        if not stored:
+            return None
+        # Vista dell'asta conclusa, non registrata tra quelle in memoria
+        auction = AuctionState(stored.pop("auction_id"), dict({"highest_bid": 0, "winner_id": -1, "sequence_number": 0}, **stored))
+        auction.state.update(highest_bid=auction.stored["highest_bid"], winner_id=auction.stored["winner_id"])
+        return auction
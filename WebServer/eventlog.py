@@ -0,0 +1,219 @@
+import os
+from bisect import bisect_right
+from pymongo.errors import BulkWriteError
+import logger
+from db import events_collection, run_db, snapshots_collection
+
+# Ogni quanti sequence_number viene salvato uno snapshot dello stato di un'asta:
+# ricostruire lo stato a un sequence_number qualsiasi riesegue al massimo SNAPSHOT_INTERVAL - 1 offerte
+SNAPSHOT_INTERVAL = int(os.environ.get("SNAPSHOT_INTERVAL", "100"))
+
+# Ordine degli eventi con lo stesso sequence_number: lo start (0) precede le offerte, l'end segue l'ultima
+STEPS = {"start": 0, "order": 1, "end": 2}
+
+def start_event(auction_id):
+    return {"auction_id": auction_id, "type": "start", "step": STEPS["start"], "sequence_number": 0}
+
+def order_events(auction_id, bids):
+    """
+    Eventi order delle offerte numerate dal server (stessi campi delle offerte salvate).
+    """
+    return [dict(bid, auction_id=auction_id, type="order", step=STEPS["order"]) for bid in bids]
+
+def end_event(auction, highest_bid, winner_id):
+    """
+    Evento end di un'asta appena chiusa: vincitore e offerta più alta sono quelli del messaggio "end".
+    """
+    return {
+        "auction_id": auction.auction_id,
+        "type": "end",
+        "step": STEPS["end"],
+        "sequence_number": auction.stored["sequence_number"],
+        "highest_bid": highest_bid,
+        "winner_id": winner_id
+    }
+
+def initial_state(auction_id):
+    return {"auction_id": auction_id, "is_active": False, "highest_bid": 0, "winner_id": -1, "sequence_number": 0, "bid_count": 0}
+
+def apply_event(state, event):
+    """
+    Applica un evento allo stato, con le stesse regole dei contatori salvati da apply_orders.
+    """
+    if event["type"] == "start":
+        state["is_active"] = True
+    elif event["type"] == "order":
+        state["highest_bid"] = max(state["highest_bid"], event["bid"])
+        state["winner_id"] = event["sender_id"]
+        state["sequence_number"] = event["sequence_number"]
+        state["bid_count"] += 1
+    else:
+        state.update(is_active=False, highest_bid=event["highest_bid"], winner_id=event["winner_id"])
+
+def replay(state, events, interval=None):
+    """
+    Applica gli eventi in ordine e restituisce gli snapshot dello stato dopo ogni offerta
+    con sequence_number multiplo di interval.
+    """
+    snapshots = []
+    for event in events:
+        apply_event(state, event)
+        if interval and event["type"] == "order" and event["sequence_number"] % interval == 0:
+            snapshots.append(dict(state))
+    return snapshots
+
+def event_key(event):
+    return (event["sequence_number"], event["step"])
+
+class EventLog:
+    """
+    Log ordinato degli eventi start/order/end di ogni asta, con uno snapshot dello stato ogni interval sequence_number.
+    Lo stato a un sequence_number N si ricostruisce dallo snapshot più vicino sotto N rieseguendo solo gli eventi
+    successivi: al più interval - 1 offerte (più l'end), qualunque sia la lunghezza dell'asta.
+    Questa classe tiene il log in memoria; MongoEventLog lo salva su MongoDB.
+    """
+
+    def __init__(self, interval=SNAPSHOT_INTERVAL):
+        self.interval = interval
+        self.live = {}       # auction_id -> stato dopo l'ultimo evento registrato, per calcolare gli snapshot
+        self.events = {}     # auction_id -> eventi in ordine
+        self.snapshots = {}  # auction_id -> snapshot in ordine di sequence_number
+
+    async def record(self, auction_id, events):
+        """
+        Registra nuovi eventi di un'asta e gli snapshot che cadono tra di loro.
+        Chiamata dal backend con il lock dell'asta (o alla sua creazione), quindi in ordine.
+        """
+        state = self.live.get(auction_id)
+        if state is None:
+            if events[0]["type"] == "start":
+                state = initial_state(auction_id)
+            else:
+                # Asta ripresa dopo un riavvio: lo stato si ricostruisce dal log stesso, fino all'evento precedente
+                # (con il journal gli eventi nuovi possono essere già stati scritti dal flusher)
+                previous = await self.state_at(auction_id, events[0]["sequence_number"] - 1)
+                state = previous or dict(initial_state(auction_id), is_active=True)
+        state = dict(state)
+        snapshots = replay(state, events, self.interval)
+        await self.store(auction_id, events, snapshots)
+        if state["is_active"]:
+            self.live[auction_id] = state
+        else:
+            self.live.pop(auction_id, None)
+
+    async def state_at(self, auction_id, at_sequence=None):
+        """
+        Stato dell'asta dopo gli eventi con sequence_number <= at_sequence (senza at_sequence: dopo l'ultimo),
+        oppure None se il log non contiene l'asta.
+        """
+        snapshot = await self.find_snapshot(auction_id, at_sequence)
+        # Gli snapshot sono presi subito dopo un'offerta: si riparte dagli eventi che la seguono
+        after = None if snapshot is None else (snapshot["sequence_number"], STEPS["order"])
+        events = await self.find_events(auction_id, after, at_sequence)
+        if snapshot is None and not events:
+            return None
+        state = dict(snapshot) if snapshot is not None else initial_state(auction_id)
+        replay(state, events)
+        return state
+
+    async def store(self, auction_id, events, snapshots):
+        self.events.setdefault(auction_id, []).extend(events)
+        self.snapshots.setdefault(auction_id, []).extend(snapshots)
+
+    async def find_snapshot(self, auction_id, at_sequence=None):
+        snapshots = self.snapshots.get(auction_id, [])
+        index = len(snapshots)
+        if at_sequence is not None:
+            index = bisect_right(snapshots, at_sequence, key=lambda snapshot: snapshot["sequence_number"])
+        return snapshots[index - 1] if index else None
+
+    async def find_events(self, auction_id, after=None, at_sequence=None):
+        """
+        Eventi successivi alla posizione after, (sequence_number, step), con sequence_number <= at_sequence.
+        """
+        events = self.events.get(auction_id, [])
+        start = 0 if after is None else bisect_right(events, after, key=event_key)
+        end = len(events) if at_sequence is None else bisect_right(events, (at_sequence, STEPS["end"]), key=event_key)
+        return events[start:end]
+
+    def contains(self, auction_id):
+        return auction_id in self.events
+
+    def take(self, auction_id):
+        """
+        Toglie dalla memoria eventi e snapshot di un'asta (persist_on_end li salva su MongoDB alla chiusura).
+        """
+        self.live.pop(auction_id, None)
+        return self.events.pop(auction_id, []), self.snapshots.pop(auction_id, [])
+
+class MongoEventLog(EventLog):
+    """
+    Log degli eventi su MongoDB (collezioni events e snapshots). Gli eventi order vengono scritti da store_bids
+    insieme alle offerte, quindi anche dal flusher del journal: qui restano start, end e snapshot.
+    """
+
+    async def store(self, auction_id, events, snapshots):
+        events = [event for event in events if event["type"] != "order"]
+        if events:
+            await run_db(insert_events, events)
+        if snapshots:
+            # Gli snapshot si possono ricostruire dagli eventi: un errore qui non fa fallire le offerte già salvate
+            try:
+                await run_db(insert_snapshots, snapshots)
+            except Exception as e:
+                logger.error("snapshot_write_failed", auction_id=auction_id, error=str(e))
+
+    async def find_snapshot(self, auction_id, at_sequence=None):
+        return await run_db(load_snapshot, auction_id, at_sequence)
+
+    async def find_events(self, auction_id, after=None, at_sequence=None):
+        return await run_db(load_events, auction_id, after, at_sequence)
+
+# Le funzioni seguenti sono chiamate bloccanti, da eseguire nel pool di thread
+
+def insert_once(collection, documents):
+    """
+    Inserisce i documenti saltando quelli già presenti (indice unico): scrivere di nuovo gli stessi eventi,
+    es. rileggendo il journal dopo un crash, non ha effetto. Restituisce i documenti saltati.
+    """
+    if not documents:
+        return []
+    try:
+        collection.insert_many([dict(document) for document in documents], ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        return [documents[error["index"]] for error in e.details["writeErrors"]]
+    return []
+
+def insert_events(events):
+    return insert_once(events_collection, events)
+
+def replace_events(events):
+    """
+    Sostituisce eventi già presenti con la stessa chiave (es. lasciati da una scrittura di offerte non conclusa).
+    """
+    for event in events:
+        key = {field: event[field] for field in ("auction_id", "sequence_number", "step")}
+        events_collection.replace_one(key, dict(event), upsert=True)
+
+def insert_snapshots(snapshots):
+    insert_once(snapshots_collection, snapshots)
+
+def load_snapshot(auction_id, at_sequence=None):
+    query = {"auction_id": auction_id}
+    if at_sequence is not None:
+        query["sequence_number"] = {"$lte": at_sequence}
+    return snapshots_collection.find_one(query, {"_id": 0}, sort=[("sequence_number", -1)])
+
+def load_events(auction_id, after=None, at_sequence=None):
+    conditions = [{"auction_id": auction_id}]
+    if after is not None:
+        conditions.append({"$or": [
+            {"sequence_number": {"$gt": after[0]}},
+            {"sequence_number": after[0], "step": {"$gt": after[1]}}
+        ]})
+    if at_sequence is not None:
+        conditions.append({"sequence_number": {"$lte": at_sequence}})
+    cursor = events_collection.find({"$and": conditions}, {"_id": 0})
+    return list(cursor.sort([("sequence_number", 1), ("step", 1)]))
@@ -0,0 +1,79 @@
+import asyncio
+import json
+from metrics import sse_dropped
+
+# Ogni quanti secondi inviare un commento di keep-alive ai client inattivi
+KEEP_ALIVE_SECONDS = 15
+
+def format_event(event_type, data):
+    """
+    Serializza un evento nel formato Server-Sent Events.
+    """
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+class EventBroadcaster:
+    """
+    Distribuisce gli eventi delle aste (start, order, end) ai client connessi.
+    Ogni client segue una singola asta oppure, senza auction_id, l'asta predefinita.
+    Ogni evento viene serializzato una sola volta, indipendentemente dal numero di client.
+    """
+
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self.channels = {}
+        self.subscribers = {}
+
+    def subscribe(self, auction_id=None):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.channels.setdefault(auction_id, set()).add(queue)
+        self.subscribers[queue] = auction_id
+        return queue
+
+    def unsubscribe(self, queue):
+        auction_id = self.subscribers.pop(queue, None)
+        channel = self.channels.get(auction_id)
+        if channel is not None:
+            channel.discard(queue)
+            if not channel:
+                del self.channels[auction_id]
+
+    def publish(self, event_type, data, auction_id=None, is_default=True):
+        """
+        Invia l'evento a chi segue l'asta auction_id e, se è l'asta predefinita, a chi segue quella.
+        """
+        queues = set(self.channels.get(auction_id, ()))
+        if is_default and auction_id is not None:
+            queues |= self.channels.get(None, set())
+        if not queues:
+            return
+        payload = format_event(event_type, dict(data, auction_id=auction_id))
+        for queue in queues:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Client troppo lento: lo disconnettiamo, alla riconnessione riceverà una nuova istantanea
+                self.unsubscribe(queue)
+                sse_dropped.inc()
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream(self, queue, snapshot):
+        """
+        Generatore per la StreamingResponse: prima l'istantanea dello stato, poi i soli eventi nuovi.
+        La coda va sottoscritta prima di leggere l'istantanea, così nessun evento va perso.
+        """
+        try:
+            yield format_event("snapshot", snapshot)
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if payload is None:
+                    break
+                yield payload
+        finally:
+            self.unsubscribe(queue)
+
+broadcaster = EventBroadcaster()
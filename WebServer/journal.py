@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import logger
+from bids import store_bids, store_bids_once
+from db import run_db
+from metrics import Counter, Gauge, Histogram
+
+# Journal delle offerte (disattivato se JOURNAL_PATH non è impostato: ogni offerta va subito su MongoDB)
+JOURNAL_PATH = os.environ.get("JOURNAL_PATH")
+# "flush": l'ack arriva dopo la scrittura nel file (sopravvive al crash del processo)
+# "fsync": l'ack arriva dopo l'fsync, condiviso tra le richieste in attesa (sopravvive a un crash del sistema)
+JOURNAL_SYNC = os.environ.get("JOURNAL_SYNC", "flush")
+# Ogni quanti secondi il flusher scrive su MongoDB le offerte accumulate
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get("JOURNAL_FLUSH_INTERVAL", "0.05"))
+# Oltre questa dimensione il file, se non si svuota mai, viene riscritto con i soli record in attesa
+JOURNAL_MAX_BYTES = int(os.environ.get("JOURNAL_MAX_BYTES", str(16 * 2**20)))
+# Attesa massima tra due tentativi quando MongoDB non risponde
+JOURNAL_MAX_BACKOFF = 5.0
+
+journal_flush_errors = Counter("journal_flush_errors_total", "Journal flushes to MongoDB that failed and will be retried")
+journal_flush_size = Histogram(
+    "journal_flush_records",
+    "Journal records written to MongoDB by a single flush",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+class Journal:
+    """
+    Journal append-only delle offerte: le richieste aggiungono un record al file e rispondono subito,
+    un flusher in background scrive i record su MongoDB a blocchi (group commit).
+    Ogni record è una riga JSON con lsn crescente; il file checkpoint contiene l'ultimo lsn scritto su MongoDB.
+    Quando tutto è stato scritto il file viene svuotato. All'avvio i record oltre il checkpoint vengono riapplicati.
+    """
+
+    def __init__(self, path, sync=JOURNAL_SYNC, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.sync = sync
+        self.flush_interval = flush_interval
+        self.lsn = 0          # Ultimo lsn assegnato
+        self.synced_lsn = 0   # Ultimo lsn reso persistente con fsync
+        self.pending = []     # Record non ancora scritti su MongoDB, in ordine di lsn
+        self.file = None
+        self.syncing = None   # fsync in corso, condiviso dalle richieste in attesa
+        self.flusher = None
+        self.flush_lock = None
+
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint:
+                return int(checkpoint.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, lsn):
+        # Sostituzione atomica: il checkpoint è sempre quello vecchio o quello nuovo
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w") as checkpoint:
+            checkpoint.write(str(lsn))
+        os.replace(temporary, self.checkpoint_path)
+
+    def read_records(self):
+        """
+        Record del file in ordine. Un'ultima riga incompleta (crash durante la scrittura) non era stata confermata e viene ignorata.
+        """
+        records = []
+        try:
+            with open(self.path, "rb") as journal_file:
+                for line in journal_file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+        except FileNotFoundError:
+            pass
+        return records
+
+    def recover(self):
+        """
+        Chiamata bloccante, all'avvio: riapplica su MongoDB i record non ancora scritti e apre il journal.
+        """
+        checkpoint = self.read_checkpoint()
+        records = self.read_records()
+        unflushed = [record for record in records if record["lsn"] > checkpoint]
+        for auction_id, bids, fields in group_records(unflushed):
+            store_bids_once(auction_id, bids, fields)
+        self.lsn = max([checkpoint] + [record["lsn"] for record in records])
+        self.synced_lsn = self.lsn
+        if unflushed:
+            logger.info("journal_recovered", records=len(unflushed), lsn=self.lsn)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.write_checkpoint(self.lsn)
+        self.file = open(self.path, "ab")
+        self.file.truncate(0)
+
+    async def append(self, auction_id, bids, fields):
+        """
+        Aggiunge un record e attende solo la scrittura nel file (e l'fsync, se richiesto), non MongoDB.
+        """
+        self.lsn += 1
+        record = {"lsn": self.lsn, "auction_id": auction_id, "bids": bids, "fields": fields}
+        self.file.write(encode_record(record))
+        self.file.flush()
+        self.pending.append(record)
+        self.start_flusher()
+        if self.sync == "fsync":
+            await self.wait_synced(record["lsn"])
+
+    async def wait_synced(self, lsn):
+        """
+        Group commit: un solo fsync rende persistenti tutti i record scritti prima del suo inizio.
+        """
+        while self.synced_lsn < lsn:
+            if self.syncing is None:
+                self.syncing = asyncio.ensure_future(self.fsync())
+            await asyncio.shield(self.syncing)
+
+    async def fsync(self):
+        target = self.lsn
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self.file.fileno())
+            self.synced_lsn = max(self.synced_lsn, target)
+        finally:
+            self.syncing = None
+
+    def start_flusher(self):
+        """
+        Avvia il flusher nell'event loop corrente, alla prima offerta (o se il loop è cambiato).
+        """
+        loop = asyncio.get_running_loop()
+        if self.flusher is None or self.flusher.done() or self.flusher.get_loop() is not loop:
+            self.flush_lock = asyncio.Lock()
+            self.flusher = loop.create_task(self.run_flusher())
+
+    async def run_flusher(self):
+        delay = self.flush_interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+                delay = self.flush_interval
+            except Exception as e:
+                journal_flush_errors.inc()
+                logger.error("journal_flush_failed", pending=len(self.pending), error=str(e))
+                delay = min(max(delay * 2, self.flush_interval), JOURNAL_MAX_BACKOFF)
+
+    async def flush(self):
+        """
+        Scrive su MongoDB i record in attesa, con un solo aggiornamento per asta.
+        Chiamata anche prima di chiudere un'asta, così la chiusura segue tutte le sue offerte.
+        """
+        if not self.pending:
+            return
+        if self.flush_lock is None:
+            self.flush_lock = asyncio.Lock()
+        async with self.flush_lock:
+            records = self.pending[:]
+            if not records:
+                return
+            for auction_id, bids, fields in group_records(records):
+                await run_db(store_bids_once, auction_id, bids, fields)
+            del self.pending[:len(records)]
+            journal_flush_size.observe(len(records))
+            self.write_checkpoint(records[-1]["lsn"])
+            if not self.pending:
+                # Tutto è su MongoDB: il journal può ripartire da un file vuoto
+                self.file.truncate(0)
+            elif self.syncing is None and os.fstat(self.file.fileno()).st_size > JOURNAL_MAX_BYTES:
+                self.compact()
+
+    def compact(self):
+        """
+        Riscrive il journal con i soli record in attesa (sotto carico continuo il file non si svuota mai).
+        Nessun await: le richieste non possono aggiungere record nel frattempo.
+        """
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as journal_file:
+            for record in self.pending:
+                journal_file.write(encode_record(record))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self.file.close()
+        os.replace(temporary, self.path)
+        self.file = open(self.path, "ab")
+
+def encode_record(record):
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+def group_records(records):
+    """
+    Unisce i record consecutivi per asta: (auction_id, offerte in ordine, campi riassuntivi dell'ultimo record).
+    """
+    grouped = {}
+    for record in records:
+        bids, fields = grouped.setdefault(record["auction_id"], ([], {}))
+        bids.extend(record["bids"])
+        fields.update(record["fields"])
+    return [(auction_id, bids, fields) for auction_id, (bids, fields) in grouped.items()]
+
+journal = Journal(JOURNAL_PATH) if JOURNAL_PATH else None
+
+Gauge("journal_pending_records", "Journal records not yet written to MongoDB", collect=lambda: {
+    (): len(journal.pending) if journal else 0
+})
+
+def recover():
+    """
+    All'avvio dell'app: riapplica il journal rimasto da un'esecuzione precedente.
+    """
+    if journal is not None:
+        journal.recover()
+
+async def write_bids(auction_id, new_bids, fields):
+    """
+    Registra le offerte di un'asta: nel journal se attivo, altrimenti direttamente su MongoDB.
+    """
+    if journal is None:
+        await run_db(store_bids, auction_id, new_bids, fields)
+    else:
+        await journal.append(auction_id, new_bids, fields)
+
+async def flush():
+    if journal is not None:
+        await journal.flush()
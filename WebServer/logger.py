@@ -0,0 +1,89 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Configurazione del log (sovrascrivibile da variabili d'ambiente)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json" oppure "text"
+# Frazione delle letture (auction_state, bids_history, ...) registrate a livello INFO
+LOG_READ_SAMPLE_RATE = float(os.environ.get("LOG_READ_SAMPLE_RATE", "0.01"))
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una riga JSON per evento: orario, livello, nome dell'evento e campi aggiuntivi.
+    """
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{self.formatTime(record)} {record.levelname} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class FastQueueHandler(QueueHandler):
+    """
+    Mette il record in coda così com'è: la formattazione avviene nel thread di scrittura.
+    I campi passati ai log devono quindi essere valori semplici, non lo stato dell'asta.
+    """
+
+    def prepare(self, record):
+        return record
+
+logger = logging.getLogger("auction")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+
+# Le richieste aggiungono i record a una coda; un thread separato li scrive su stdout
+log_queue = queue.SimpleQueue()
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+logger.addHandler(FastQueueHandler(log_queue))
+listener = QueueListener(log_queue, stream_handler)
+listener.start()
+# Scrive i record rimasti in coda all'uscita
+atexit.register(listener.stop)
+
+def log_event(level, event, **fields):
+    """
+    Registra un evento con campi strutturati; se il livello è disattivato costa un solo controllo.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+def debug(event, **fields):
+    log_event(logging.DEBUG, event, **fields)
+
+def info(event, **fields):
+    log_event(logging.INFO, event, **fields)
+
+def warning(event, **fields):
+    log_event(logging.WARNING, event, **fields)
+
+def error(event, **fields):
+    """
+    Errore con lo stack dell'eccezione in corso, se c'è.
+    """
+    if logger.isEnabledFor(logging.ERROR):
+        logger.error(event, exc_info=sys.exc_info()[0] is not None, extra={"fields": fields})
+
+def read(event, **fields):
+    """
+    Letture dei client (dashboard, polling): tutte a livello DEBUG, un campione a livello INFO.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(event, extra={"fields": fields})
+    elif LOG_READ_SAMPLE_RATE and random.random() < LOG_READ_SAMPLE_RATE and logger.isEnabledFor(logging.INFO):
+        logger.info(event, extra={"fields": dict(fields, sampled=LOG_READ_SAMPLE_RATE)})
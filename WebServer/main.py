@@ -1,43 +1,50 @@
-from fastapi import FastAPI, HTTPException, Form, Request
+from fastapi import FastAPI, HTTPException, Form, Query, Request
 from pydantic import BaseModel
-from pymongo import MongoClient
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi import Request
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+import asyncio
 import uvicorn
+import logger
+import time
+from contextlib import asynccontextmanager
+from itertools import groupby
+from typing import List, Optional
+from engine import AuctionEngine, new_auction_state
+from sequencer import BidMessage, sequencer_for
+from events import broadcaster
+from metrics import MetricsMiddleware, duplicate_messages, render, timed_message, track_sequence, watch
+from bids import AUCTIONS_PAGE, MAX_AUCTIONS_PAGE, SequenceConflict, slice_bid_history
+from storage import AuctionExists, create_storage
+from wire import WireRoute, compact, compact_ack, respond
+from caching import CachedStaticFiles, auction_etag, is_fresh, not_modified, versioned
+from analytics import METRICS, SENDERS_LIMIT, SERIES_POINTS, BidAnalytics, require_numpy
 
-app = FastAPI()
+# Backend di persistenza scelto con STORAGE_BACKEND: memory, write_through (predefinito) o persist_on_end
+storage = create_storage()
 
-# Connessione a MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["auction_db"]
-auction_collection = db["auctions"]
-counter_collection = db["counters"]
+@asynccontextmanager
+async def lifespan(app):
+    # La connessione a MongoDB, il contatore degli auction_id, gli indici e il journal
+    # vengono preparati qui e non all'import del modulo
+    logger.info("storage_opening", backend=storage.name)
+    await storage.open()
+    yield
+    await storage.close()
 
-# Assicurati che esista un contatore per auction_id
-if not counter_collection.find_one({"_id": "auction_id"}):
-    counter_collection.insert_one({"_id": "auction_id", "sequence_value": 0})
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+# Gli endpoint accettano anche corpi MessagePack e CBOR
+app.router.route_class = WireRoute
 
-def get_next_sequence_value(sequence_name):
-    """
-    Genera un ID incrementale basato sul nome del contatore.
-    """
-    result = counter_collection.find_one_and_update(
-        {"_id": sequence_name},
-        {"$inc": {"sequence_value": 1}},
-        return_document=True
-    )
-    return result["sequence_value"]
+# Aste attive in memoria indicizzate per auction_id, ognuna con il proprio stato e lock
+engine = AuctionEngine(storage)
+watch(engine, broadcaster)
+# Analisi vettoriali delle offerte delle aste concluse, per la pagina delle statistiche
+analytics = BidAnalytics(storage)
 
-auction_state ={
-    "is_active": False,
-    "highest_bid": 0,
-    "winner_id": -1,
-    "sequence_number": 0,
-    "bid_history": [],
-    "item":{}
-}
+# Oggetto configurato dalla home, assegnato alla prossima asta predefinita
+auction_item = {}
 
 class AuctionMessage(BaseModel):
     bid: int
@@ -47,25 +54,29 @@ class AuctionMessage(BaseModel):
     winner_id: int
     sequence_number: int
     message_type: str
+    auction_id: Optional[int] = None  # Asta a cui è destinato il messaggio (assente: asta predefinita)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+class ESPCommand(BaseModel):
+    command: str
+    value: int
+
+static_files = CachedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_files.url
 
 # Endpoint iniziale per la configurazione dell'asta
 @app.post("/set-auction")
 async def set_auction(request: Request, item_name: str = Form(...), item_description: str = Form(...)):
-    print(f"Setting up auction: {item_name}, {item_description}")
+    logger.info("auction_configured", item_name=item_name)
 
     # Inizializza lo stato dell'asta
-    auction_state["is_active"] = False
-    auction_state["highest_bid"] = 0
-    auction_state["winner_id"] = -1
-    auction_state["sequence_number"] = 0
-    auction_state["bid_history"] = []
-    auction_state["item"] = {
+    engine.reset_default()
+    auction_item.clear()
+    auction_item.update({
         "name": item_name,
         "description": item_description,
-    }
+    })
 
      # Passa nome e descrizione al template
     return templates.TemplateResponse("dashboard.html", {
@@ -74,177 +85,515 @@ async def set_auction(request: Request, item_name: str = Form(...), item_descrip
         "item_description": item_description
     })
 
-@app.post("/receive-data")
-async def receive_data(message: AuctionMessage):
-    print(f"Received auction message: {message}")
-    try:
-        if message.message_type == "order":
-            # Aggiorno lo stato locale dell'asta
-            print(f"Processing bid from sender {message.sender_id} with amount {message.bid}")
-            auction_state["highest_bid"] = message.highest_bid
-            auction_state["bid_history"].append({"bid": message.bid, "sender_id": message.sender_id, "sequence_number": message.sequence_number})
-            auction_state["winner_id"] = message.winner_id
+async def apply_orders(auction_id, messages):
+    """
+    Registra in ordine una serie di offerte nello stato locale e nel backend di persistenza.
+    Il backend riceve le offerte tutte insieme (su MongoDB un solo update, vedi store_bids).
+    """
+    # Asta dalla memoria (letta dal database solo se non è in memoria, es. dopo un riavvio)
+    auction = await engine.get_or_load(auction_id)
+    if not auction:
+        raise HTTPException(status_code=404, detail="No active auction found")
 
-            # Aggiorna l'asta nel database
-                # Trova l'asta attiva
-            auction = auction_collection.find_one({"is_active": True})
-            if not auction:
-                raise HTTPException(status_code=404, detail="No active auction found")
+    # Il lock dell'asta rende atomico leggere e incrementare il sequence_number
+    async with auction.lock:
+        # Le ritrasmissioni vengono scartate prima di toccare lo stato e il database
+        messages = auction.dedup.fresh(messages)
+        if not messages:
+            return auction
 
-                # Aggiorna l'asta con il nuovo bid
-            updated_bid = {
+        # Offerte numerate dal server: lo stesso sequence_number vale in memoria, nel backend e negli eventi
+        sequence_number = auction.stored["sequence_number"]
+        highest_bid = auction.stored["highest_bid"]
+        received_at = time.time()  # Per i tempi tra le offerte nelle analisi: uno solo per richiesta
+        new_bids = []
+        for message in messages:
+            sequence_number += 1  # Incrementa il sequence_number
+            highest_bid = max(message.bid, highest_bid)
+            new_bids.append({
                 "bid": message.bid,
                 "sender_id": message.sender_id,
-                "sequence_number": auction["sequence_number"] + 1  # Incrementa il sequence_number
-            }
-            auction_collection.update_one(
-                {"auction_id": auction["auction_id"]},
-                {"$set": {
-                    "highest_bid": max(message.bid, auction["highest_bid"]),
-                    "winner_id": message.sender_id,
-                    "sequence_number": updated_bid["sequence_number"]
-                },
-                "$push": {
-                    "bid_history": updated_bid
-                }}
+                "message_id": message.message_id,
+                "sequence_number": sequence_number,
+                "received_at": received_at
+            })
+
+        # Prima il backend: se la scrittura fallisce memoria, dedup e client restano com'erano
+        # e il messaggio ritrasmesso viene applicato di nuovo
+        try:
+            await storage.bids_added(
+                auction.auction_id,
+                new_bids,
+                {
+                    "highest_bid": highest_bid,
+                    "winner_id": messages[-1].sender_id,
+                    "sequence_number": sequence_number
+                }
             )
+        except Exception as e:
+            # L'errore può arrivare dopo la scrittura (es. risposta di MongoDB persa): prima di rilasciare il lock
+            # i contatori si rileggono dal backend, così il lotto successivo non riusa sequence_number già salvati
+            stored = await engine.reload(auction)
+            if isinstance(e, SequenceConflict) or stored is None or stored["sequence_number"] != sequence_number:
+                raise
+            logger.error("bids_stored_with_error", auction_id=auction.auction_id, sequence_number=sequence_number, error=str(e))
+        auction.stored.update(highest_bid=highest_bid, winner_id=messages[-1].sender_id, sequence_number=sequence_number)
+        auction.dedup.mark_all(messages)
+
+        # Aggiorno lo stato locale dell'asta
+        auction_state = auction.state
+        for message, bid in zip(messages, new_bids):
+            logger.debug("order", auction_id=auction.auction_id, sender_id=message.sender_id, bid=message.bid, sequence_number=bid["sequence_number"])
+            # Il controllo dei buchi usa la numerazione del sequenziatore (vedi track_sequence)
+            track_sequence(auction, message.sequence_number)
+            auction_state["highest_bid"] = message.highest_bid
+            auction_state["bid_history"].append(bid)
+            auction_state["winner_id"] = message.winner_id
+            broadcaster.publish("order", {
+                "bid": message.bid,
+                "sender_id": message.sender_id,
+                "message_id": message.message_id,
+                "sequence_number": bid["sequence_number"],
+                "highest_bid": auction_state["highest_bid"],
+                "winner_id": auction_state["winner_id"]
+            }, auction.auction_id, engine.is_default(auction.auction_id))
+    return auction
+
+async def start_auction(message):
+    # Uno "start" ritrasmesso restituisce l'asta che ha già avviato
+    start_key = (message.sender_id, message.message_id)
+    auction = engine.repeated_start(message.auction_id, start_key)
+    if auction is not None:
+        duplicate_messages.inc("start")
+        return auction
+
+    # Uno "start" uguale ancora in corso (arrivato mentre l'originale aspetta il database): se ne attende l'esito
+    key = (message.auction_id, start_key)
+    pending = engine.starting.get(key)
+    if pending is not None:
+        auction = await asyncio.shield(pending)
+        duplicate_messages.inc("start")
+        return auction
+
+    # L'auction_id esplicito viene riservato prima del primo await: due "start" diversi non possono crearlo entrambi
+    if message.auction_id is not None and (engine.get(message.auction_id) or engine.is_starting(message.auction_id)):
+        raise HTTPException(status_code=409, detail=f"Auction {message.auction_id} already exists")
+    started = asyncio.get_running_loop().create_future()
+    engine.starting[key] = started
+    try:
+        auction = await create_auction(message, start_key)
+    except BaseException as e:
+        if isinstance(e, Exception):
+            started.set_exception(e)
+            started.exception()  # Letta qui: evita l'avviso se nessuna ritrasmissione la aspetta
+        else:
+            started.cancel()
+        raise
+    else:
+        started.set_result(auction)
+    finally:
+        del engine.starting[key]
+    return auction
+
+async def create_auction(message, start_key):
+    """
+    Crea l'asta nel backend e solo dopo la registra in memoria e la annuncia ai client.
+    """
+    if message.auction_id is None:
+        # Genera automaticamente un auction_id incrementale
+        auction_id = await storage.next_auction_id()
+    else:
+        auction_id = message.auction_id
+        if await storage.exists(auction_id):
+            raise HTTPException(status_code=409, detail=f"Auction {auction_id} already exists")
+    try:
+        await storage.auction_started(auction_id, default=message.auction_id is None)
+    except AuctionExists:
+        raise HTTPException(status_code=409, detail=f"Auction {auction_id} already exists")
+
+    logger.info("auction_started", auction_id=auction_id)
+    # Aggiorno lo stato locale dell'asta
+    auction = engine.add(auction_id, default=message.auction_id is None)
+    auction.state["is_active"] = True
+    auction.start_key = start_key
+    if engine.is_default(auction_id):
+        auction.state["item"] = dict(auction_item)
+    broadcaster.publish("start", {"is_active": True, "highest_bid": 0, "winner_id": -1}, auction_id, engine.is_default(auction_id))
+    return auction
+
+async def end_auction(message):
+    # Un "end" ritrasmesso non chiude di nuovo l'asta
+    ended = await engine.find_ended(message.auction_id)
+    if ended is not None:
+        duplicate_messages.inc("end")
+        return ended
+
+    auction = await engine.get_or_load(message.auction_id)
+    if not auction:
+        raise HTTPException(status_code=404, detail="No active auction found")
+
+    # Attende che le offerte già in corso su questa asta siano scritte
+    async with auction.lock:
+        if not auction.state["is_active"]:
+            # Un "end" uguale l'ha chiusa mentre questo aspettava il lock
+            duplicate_messages.inc("end")
+            return auction
+        # Termina l'asta nel backend (con write_through dopo aver scritto le offerte ancora nel journal);
+        # se fallisce l'asta resta attiva e un "end" ritrasmesso riprova la chiusura
+        await storage.auction_ended(auction, message.highest_bid, message.winner_id)
+
+        # Aggiorno lo stato locale dell'asta
+        auction_state = auction.state
+        auction_state["is_active"] = False
+        auction_state["winner_id"] = message.winner_id
+        auction_state["highest_bid"] = message.highest_bid
+        broadcaster.publish("end", {
+            "is_active": False,
+            "highest_bid": message.highest_bid,
+            "winner_id": message.winner_id
+        }, auction.auction_id, engine.is_default(auction.auction_id))
+        engine.finish(auction.auction_id)
+    analytics.auction_ended(auction.auction_id)
+    logger.info("auction_ended", auction_id=auction.auction_id, winner_id=message.winner_id, highest_bid=message.highest_bid)
+    return auction
+
+def last_sequence_number(auction):
+    """
+    sequence_number dell'ultima offerta registrata nell'asta (None se non ce ne sono).
+    """
+    bid_history = auction.state["bid_history"] if auction else []
+    return bid_history[-1]["sequence_number"] if bid_history else None
+
+@app.post("/receive-data")
+@timed_message
+async def receive_data(message: AuctionMessage, request: Request, ack: Optional[str] = None):
+    """
+    Applica un messaggio del sequenziatore. Con ack=compact (o ACK_MODE=compact) risponde solo con
+    status, auction_id e sequence_number invece dello stato completo dell'asta.
+    """
+    try:
+        if message.message_type == "order":
+            auction = await apply_orders(message.auction_id, [message])
 
         elif message.message_type == "start":
-            # Aggiorno lo stato locale dell'asta
-            print("Starting new auction")
-            auction_state["is_active"] = True
-            auction_state["highest_bid"] = 0
-            auction_state["winner_id"] = -1
-            auction_state["sequence_number"] = 0
-            auction_state["bid_history"] = []
-
-            # Genera automaticamente un auction_id incrementale
-            auction_id = get_next_sequence_value("auction_id")
-            # Inserisci l'asta nel database
-            new_auction = {
-                "auction_id": auction_id,
-                "is_active": True,
-                "highest_bid": 0,
-                "winner_id": -1,
-                "sequence_number": 0,
-                "bid_history": []
-            }
-            auction_collection.insert_one(new_auction)
+            auction = await start_auction(message)
 
         elif message.message_type == "end":
-            print(f"Ending auction. Winner: {message.winner_id}, Final bid: {message.highest_bid}")
-            # Aggiorno lo stato locale dell'asta
-            auction_state["is_active"] = False
-            auction_state["winner_id"] = message.winner_id
-            auction_state["highest_bid"] = message.highest_bid
+            auction = await end_auction(message)
+
+        else:
+            auction = engine.get(message.auction_id)
+
+        if compact(ack):
+            return respond(request, compact_ack("message received", auction.auction_id if auction else None, last_sequence_number(auction)))
+        return respond(request, {"status": "message received", "current_state": auction.state if auction else None})
+
+    except HTTPException:
+        # 404/409 restano tali, non diventano 500
+        raise
+    except Exception as e:
+        logger.error("message_failed", message_type=message.message_type, auction_id=message.auction_id, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
-            # Termina l'asta attiva nel database
-            auction = auction_collection.find_one({"is_active": True})
+@app.post("/receive-data/batch")
+async def receive_data_batch(messages: List[AuctionMessage], request: Request):
+    """
+    Applica in ordine un lotto di messaggi del sequenziatore con un solo ack, anche destinati ad aste diverse.
+    Le offerte consecutive per la stessa asta vengono passate al backend in un solo blocco.
+    """
+    logger.debug("batch", size=len(messages))
+    try:
+        pending_orders = []
+        auction = None
+        for message in messages + [None]:
+            # Scrive in blocco le offerte accumulate prima di start/end o di un cambio di asta
+            if pending_orders and (message is None or message.message_type != "order"
+                                   or message.auction_id != pending_orders[0].auction_id):
+                auction = await apply_orders(pending_orders[0].auction_id, pending_orders)
+                pending_orders = []
+
+            if message is None:
+                break
+            elif message.message_type == "order":
+                pending_orders.append(message)
+            elif message.message_type == "start":
+                auction = await start_auction(message)
+            elif message.message_type == "end":
+                auction = await end_auction(message)
+
+        return respond(request, {
+            "status": "batch received",
+            "received": len(messages),
+            "auction_id": auction.auction_id if auction else None,
+            "sequence_number": last_sequence_number(auction)
+        })
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("batch_failed", size=len(messages), error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/sequencer/bid")
+async def sequencer_bid(message: BidMessage):
+    return await sequencer_bids([message])
+
+@app.post("/sequencer/bids")
+async def sequencer_bids(messages: List[BidMessage]):
+    """
+    Sequenziatore lato server, alternativo al nodo 0: riceve le offerte ("bid") con il vector clock,
+    le ordina e applica subito gli ordini sbloccati come farebbe /receive-data.
+    Restituisce gli ordini assegnati, da inoltrare ai nodi; le offerte non ancora causali restano in attesa.
+    """
+    orders = []
+    held_back = 0
+    try:
+        for auction_id, group in groupby(messages, key=lambda message: message.auction_id):
+            auction = await engine.get_or_load(auction_id)
             if not auction:
                 raise HTTPException(status_code=404, detail="No active auction found")
 
-            auction_collection.update_one(
-                {"auction_id": auction["auction_id"]},
-                {"$set": {"is_active": False}}
-            )
+            sequencer = await sequencer_for(auction, storage)
+            # Dalla consegna alla scrittura una richiesta alla volta: se gli ordini non vengono salvati
+            # il sequenziatore torna com'era e le stesse offerte possono essere inviate di nuovo
+            async with sequencer.lock:
+                state = sequencer.checkpoint()
+                new_orders = [order for message in group for order in sequencer.submit(message)]
+                if new_orders:
+                    try:
+                        await apply_orders(auction.auction_id, [AuctionMessage(**order) for order in new_orders])
+                    except BaseException:
+                        sequencer.rollback(state)
+                        raise
+                held_back = len(sequencer.pending)
+            orders.extend(new_orders)
 
-        response = {"status": "message received", "current_state": auction_state}
-        print(f"Sending response: {response}")
-        return response
+        return {"status": "bids received", "received": len(messages), "orders": orders, "held_back": held_back}
 
     except Exception as e:
-        print(f"Error processing message: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-    
+        if not isinstance(e, HTTPException):
+            logger.error("sequencing_failed", size=len(messages), error=str(e))
+            e = HTTPException(status_code=500, detail=str(e))
+        if orders:
+            # Gli ordini delle aste precedenti nel lotto sono già applicati: vanno comunque inoltrati ai nodi
+            raise HTTPException(status_code=e.status_code, detail={"error": e.detail, "orders": orders})
+        raise e
+
+async def current_state(auction_id=None):
+    """
+    Stato in memoria dell'asta richiesta (predefinita: l'ultima avviata senza auction_id).
+    Un'asta conclusa che non è più in memoria viene letta dal backend.
+    """
+    auction = engine.get(auction_id)
+    if auction is not None:
+        return auction.state
+    if auction_id is not None:
+        stored = await storage.read_auction(auction_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail=f"Auction {auction_id} not found")
+        return stored
+    return new_auction_state(dict(auction_item))
+
+def current_etag(auction_id=None):
+    """
+    Versione dell'asta richiesta, None se non è in memoria (risposta senza ETag).
+    """
+    auction = engine.get(auction_id)
+    return auction_etag(auction) if auction is not None else None
+
 @app.get("/stats-page")
 async def stats_page(request: Request):
-    print("Received request for dashboard page")
     return templates.TemplateResponse("stats.html",{"request": request})
 
 @app.get("/auction_state")
-async def get_auction_state():
-    print("Received request for auction state")
-    print(f"Sending current auction state: {auction_state}")
-    return auction_state
+async def get_auction_state(request: Request, auction_id: Optional[int] = None):
+    """
+    Restituisce lo stato dell'asta con la sua versione nell'ETag: se il client ha già quella versione
+    (If-None-Match) risponde 304 senza serializzare nulla.
+    """
+    etag = current_etag(auction_id)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    auction_state = await current_state(auction_id)
+    logger.read("auction_state", auction_id=auction_id, bids=len(auction_state["bid_history"]))
+    return versioned(request, auction_state, etag)
+
+@app.get("/active_auctions")
+async def get_active_auctions():
+    """
+    Restituisce le aste attive in memoria, senza storico delle offerte.
+    """
+    auctions = [
+        dict({key: value for key, value in auction.state.items() if key != "bid_history"}, auction_id=auction_id)
+        for auction_id, auction in engine.auctions.items() if auction.state["is_active"]
+    ]
+    return {"auctions": auctions, "default_auction_id": engine.default_auction_id}
 
 @app.get("/bids_history")
-async def get_bid_history():
-    print("Received request for bid history")
-    print(f"Sending bid history: {auction_state['bid_history']}")
-    return auction_state["bid_history"]
+async def get_bid_history(request: Request, auction_id: Optional[int] = None, since_sequence: Optional[int] = None,
+                          limit: Optional[int] = Query(None, ge=1)):
+    """
+    Restituisce lo storico delle offerte; con since_sequence e limit solo le offerte successive al cursore.
+    Come /auction_state risponde 304 se l'asta non è cambiata dalla versione del client.
+    """
+    etag = current_etag(auction_id)
+    if is_fresh(request, etag):
+        return not_modified(etag)
+    if auction_id is not None and engine.get(auction_id) is None:
+        # Il backend legge solo la pagina richiesta, senza caricare tutto lo storico
+        bids = await storage.read_bids(auction_id, since_sequence, limit)
+        if bids is None:
+            raise HTTPException(status_code=404, detail=f"Auction {auction_id} not found")
+    else:
+        bids = slice_bid_history((await current_state(auction_id))["bid_history"], since_sequence, limit)
+    logger.read("bids_history", auction_id=auction_id, since_sequence=since_sequence, count=len(bids))
+    return versioned(request, bids, etag)
+
+@app.get("/auctions/{auction_id}/state")
+async def get_auction_state_at(auction_id: int, at_sequence: Optional[int] = None):
+    """
+    Stato di un'asta dopo l'offerta at_sequence (senza at_sequence: quello attuale), ricostruito dallo snapshot
+    più vicino e dagli eventi successivi del log, senza rileggere lo storico delle offerte.
+    """
+    if at_sequence is not None and at_sequence < 0:
+        raise HTTPException(status_code=400, detail="at_sequence must be >= 0")
+    try:
+        state = await storage.state_at(auction_id, at_sequence)
+
+    except Exception as e:
+        logger.error("state_replay_failed", auction_id=auction_id, at_sequence=at_sequence, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Auction {auction_id} not found")
+    logger.read("auction_state_at", auction_id=auction_id, at_sequence=at_sequence)
+    return state
+
+@app.get("/events")
+async def auction_events(auction_id: Optional[int] = None):
+    """
+    Canale Server-Sent Events: istantanea dello stato alla connessione, poi solo gli eventi nuovi.
+    Senza auction_id segue l'asta predefinita.
+    """
+    # Sottoscrive prima di leggere l'istantanea: gli eventi pubblicati mentre la si legge dal backend restano in coda
+    queue = broadcaster.subscribe(auction_id)
+    try:
+        # Lo storico non fa parte dell'istantanea: il client lo legge a pagine da /bids_history
+        snapshot = {key: value for key, value in (await current_state(auction_id)).items() if key != "bid_history"}
+    except BaseException:
+        broadcaster.unsubscribe(queue)
+        raise
+    return StreamingResponse(broadcaster.stream(queue, snapshot), media_type="text/event-stream")
 
 @app.get("/all_auctions")
-async def get_all_auctions():
+async def get_all_auctions(fields: Optional[str] = None, after_id: Optional[int] = None, limit: Optional[int] = Query(None, ge=1)):
+    """
+    Restituisce tutte le aste del backend.
+    Con fields, after_id o limit restituisce una pagina ordinata per auction_id e il cursore della pagina successiva;
+    fields=summary esclude lo storico delle offerte.
+    """
+    if fields is None and after_id is None and limit is None:
+        auctions = await storage.all_auctions()
+        return {"auctions": auctions}
+
+    page_size = limit or AUCTIONS_PAGE
+    auctions = await storage.find_auctions(fields or "full", after_id, page_size)
+    next_after_id = auctions[-1]["auction_id"] if len(auctions) == min(page_size, MAX_AUCTIONS_PAGE) else None
+    return {"auctions": auctions, "next_after_id": next_after_id}
+
+@app.get("/all_auctions/stream")
+async def stream_all_auctions(fields: str = "full"):
+    """
+    Restituisce tutte le aste in streaming, una per riga (NDJSON).
     """
-    Restituisce tutte le aste nel database.
+    return StreamingResponse(storage.stream_auctions(fields), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Metriche in formato Prometheus (latenze, operazioni MongoDB, aste e client SSE).
     """
-    auctions = list(auction_collection.find({}, {"_id": 0}))
-    return {"auctions": auctions}
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/auction_stats")
 async def auction_statistics():
     try:
-        # Offerta vincente media
-        avg_winning_bid = auction_collection.aggregate([
-            {"$match": {"is_active": False}},  # Solo aste concluse
-            {"$group": {"_id": None, "average_winning_bid": {"$avg": "$highest_bid"}}}
-        ])
-        avg_winning_bid = list(avg_winning_bid)
-        avg_winning_bid = avg_winning_bid[0]["average_winning_bid"] if avg_winning_bid else 0
-
-        # Numero medio di offerte per asta
-        avg_bids_per_auction = auction_collection.aggregate([
-            {"$match": {"is_active": False}},  # Solo aste concluse
-            {"$project": {"num_bids": {"$size": "$bid_history"}}},  # Conta le offerte
-            {"$group": {"_id": None, "average_bids": {"$avg": "$num_bids"}}}
-        ])
-        avg_bids_per_auction = list(avg_bids_per_auction)
-        avg_bids_per_auction = avg_bids_per_auction[0]["average_bids"] if avg_bids_per_auction else 0
-
-        # Offerta vincente più alta e più bassa
-        winning_bids = auction_collection.aggregate([
-            {"$match": {"is_active": False}},  # Solo aste concluse
-            {"$group": {
-                "_id": None,
-                "max_winning_bid": {"$max": "$highest_bid"},
-                "min_winning_bid": {"$min": "$highest_bid"}
-            }}
-        ])
-        winning_bids = list(winning_bids)
-        max_winning_bid = winning_bids[0]["max_winning_bid"] if winning_bids else 0
-        min_winning_bid = winning_bids[0]["min_winning_bid"] if winning_bids else 0
-
-        # Numero totale di aste concluse e attive
-        total_active = auction_collection.count_documents({"is_active": True})
-        total_concluded = auction_collection.count_documents({"is_active": False})
-
-        return {
-            "average_winning_bid": avg_winning_bid,
-            "average_bids_per_auction": avg_bids_per_auction,
-            "max_winning_bid": max_winning_bid,
-            "min_winning_bid": min_winning_bid,
-            "total_active_auctions": total_active,
-            "total_concluded_auctions": total_concluded
-        }
+        # Legge il riepilogo mantenuto in modo incrementale da start/end
+        return await storage.stats()
+
+    except Exception as e:
+        logger.error("stats_failed", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/auction_stats/series/{metric}")
+async def auction_statistics_series(metric: str, points: int = SERIES_POINTS):
+    """
+    Serie di una metrica per ogni asta conclusa (winning_bid, bids_per_auction, bid_increment),
+    ridotta a points intervalli con media, minimo e massimo.
+    """
+    require_numpy()
+    if metric not in METRICS:
+        raise HTTPException(status_code=404, detail=f"Unknown metric {metric}")
+    try:
+        return await analytics.series(metric, points)
+
+    except Exception as e:
+        logger.error("analytics_failed", metric=metric, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/auction_stats/senders")
+async def auction_statistics_senders(limit: int = SENDERS_LIMIT):
+    """
+    Aste vinte e tasso di vittoria dei mittenti che hanno vinto di più.
+    """
+    require_numpy()
+    try:
+        return await analytics.senders(limit)
 
     except Exception as e:
+        logger.error("analytics_failed", metric="senders", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/auction_stats/inter_arrival")
+async def auction_statistics_inter_arrival():
+    """
+    Percentili del tempo (in secondi) tra offerte successive della stessa asta.
+    """
+    require_numpy()
+    try:
+        return await analytics.inter_arrival()
+
+    except Exception as e:
+        logger.error("analytics_failed", metric="inter_arrival", error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/rebuild_stats")
+async def rebuild_auction_statistics():
+    """
+    Ricalcola il riepilogo delle statistiche da tutte le aste salvate.
+    """
+    try:
+        return await storage.rebuild_stats()
+
+    except Exception as e:
+        logger.error("stats_rebuild_failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/reset-auction")
 async def reset_auction(request: Request):
-    print("Resetting auction")
-    auction_state["is_active"] = False
-    auction_state["highest_bid"] = 0
-    auction_state["winner_id"] = -1
-    auction_state["sequence_number"] = 0
-    auction_state["bid_history"] = []
+    logger.info("auction_reset")
+    engine.reset_default()
     return templates.TemplateResponse("home.html", {"request": request})
 
+@app.post("/send-command")
+async def send_command(command: ESPCommand):
+    logger.info("command", command=command.command, value=command.value)
+    response = {"status": "command sent", "command": command}
+    return response
+
 @app.get("/", response_class=HTMLResponse)
 async def get_dashboard(request: Request):
-    print("Received request for dashboard page")
     return templates.TemplateResponse("home.html", {"request": request})
 
 if __name__ == "__main__":
-    print("Starting server on http://0.0.0.0:8000")
+    logger.info("server_starting", url="http://0.0.0.0:8000")
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
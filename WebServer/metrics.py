@@ -0,0 +1,230 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Limiti (in secondi) degli istogrammi di latenza
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metriche esposte da /metrics, nell'ordine di registrazione
+registry = []
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+class Metric:
+    """
+    Metrica in formato Prometheus. I valori sono indicizzati per la tupla dei valori delle etichette.
+    Gli aggiornamenti avvengono nel thread dell'event loop: bastano un dizionario e qualche somma.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        registry.append(self)
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, self.labelnames, labels, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labelnames, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labelnames, labels)} {value}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    """
+    Gauge aggiornato dal codice oppure, con collect, calcolato solo quando /metrics viene letto.
+    collect restituisce un dizionario {tupla delle etichette: valore}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def samples(self):
+        if self.collect is not None:
+            self.values = self.collect()
+        return super().samples()
+
+class Timer:
+    """
+    Context manager che registra in un istogramma la durata del blocco.
+    """
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # Conteggi per bucket (l'ultimo è +Inf) e somma dei valori
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        labelnames = self.labelnames + ("le",)
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labelnames, labels + (bound,), cumulative
+            yield f"{self.name}_sum", self.labelnames, labels, total
+            yield f"{self.name}_count", self.labelnames, labels, cumulative
+
+# Richieste HTTP
+requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency, including validation and response serialization",
+    ("method", "route", "status")
+)
+
+# Messaggi del sequenziatore: tempo del solo handler, escluse validazione e serializzazione
+message_duration = Histogram(
+    "auction_message_duration_seconds",
+    "Time spent handling a /receive-data message, by message_type",
+    ("message_type",)
+)
+
+# Operazioni su MongoDB eseguite tramite run_db
+mongo_in_flight = Gauge("mongo_operations_in_flight", "MongoDB operations submitted to the thread pool and not yet completed")
+mongo_duration = Histogram("mongo_operation_duration_seconds", "MongoDB operation execution time", ("operation",))
+mongo_wait = Histogram("mongo_operation_wait_seconds", "Time MongoDB operations waited for a free thread", ("operation",))
+mongo_errors = Counter("mongo_operation_errors_total", "MongoDB operations that raised an exception", ("operation",))
+
+# Ordini ricevuti: un buco nei sequence_number indica messaggi "order" persi
+sequence_gaps = Counter("auction_sequence_gaps_total", "Order messages missing from the sequence_number stream")
+sequence_regressions = Counter(
+    "auction_sequence_regressions_total",
+    "Order messages whose sequence_number was not greater than the previous one (duplicates or reordering)"
+)
+
+# Ritrasmissioni riconosciute e scartate prima di arrivare al database
+duplicate_messages = Counter(
+    "auction_duplicate_messages_total",
+    "Retransmitted messages dropped before reaching storage",
+    ("message_type",)
+)
+
+# Client Server-Sent Events
+sse_dropped = Counter("sse_dropped_subscribers_total", "SSE clients disconnected because their queue was full")
+
+def timed_message(handler):
+    """
+    Decoratore per l'handler di /receive-data: registra la durata per message_type.
+    wraps conserva la firma, quindi FastAPI continua a validare il messaggio come prima.
+    """
+    @wraps(handler)
+    async def wrapper(message, **kwargs):
+        with message_duration.time(message.message_type):
+            return await handler(message, **kwargs)
+    return wrapper
+
+def render():
+    """
+    Tutte le metriche registrate nel formato testuale di Prometheus.
+    """
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+def track_sequence(auction, sequence_number):
+    """
+    Confronta il sequence_number di un ordine con quello atteso per l'asta.
+    """
+    expected = auction.next_sequence_number
+    if expected is not None:
+        if sequence_number > expected:
+            sequence_gaps.inc(amount=sequence_number - expected)
+        elif sequence_number < expected:
+            sequence_regressions.inc()
+            return
+    auction.next_sequence_number = sequence_number + 1
+
+def watch(engine, broadcaster):
+    """
+    Gauge calcolati alla lettura di /metrics a partire dalle aste in memoria e dai client SSE.
+    """
+    Gauge("auctions_active", "Active auctions held in memory", collect=lambda: {
+        (): sum(1 for auction in engine.auctions.values() if auction.state["is_active"])
+    })
+    # Lo storico in memoria o il contatore delle offerte registrate (più alto dopo un riavvio)
+    Gauge("auction_bid_history_size", "Bids recorded for each auction held in memory", ("auction_id",), collect=lambda: {
+        (auction_id,): max(len(auction.state["bid_history"]), auction.stored["sequence_number"])
+        for auction_id, auction in engine.auctions.items()
+    })
+    Gauge("sse_subscribers", "Connected SSE clients", collect=lambda: {(): len(broadcaster.subscribers)})
+    Gauge("sse_channels", "Auctions followed by at least one SSE client", collect=lambda: {(): len(broadcaster.channels)})
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI che misura latenza e richieste in corso per ogni route.
+    La route è quella registrata (es. /bids_history), così il numero di serie resta limitato.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe(time.perf_counter() - started, scope["method"], route, status[0])
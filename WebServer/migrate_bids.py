@@ -0,0 +1,40 @@
+from pymongo import UpdateOne
+from db import auction_collection, bids_collection, ensure_indexes
+
+def migrate_auction(auction):
+    """
+    Sposta lo storico delle offerte di un'asta nella collezione bids e lascia nel documento solo bid_count.
+    Le offerte sono scritte con upsert su (auction_id, sequence_number): rieseguire la migrazione è sicuro.
+    """
+    bids = auction.get("bid_history", [])
+    if bids:
+        bids_collection.bulk_write([
+            UpdateOne(
+                {"auction_id": auction["auction_id"], "sequence_number": bid["sequence_number"]},
+                {"$set": dict(bid, auction_id=auction["auction_id"])},
+                upsert=True
+            )
+            for bid in bids
+        ], ordered=False)
+
+    auction_collection.update_one(
+        {"_id": auction["_id"]},
+        {"$set": {"bid_count": len(bids)}, "$unset": {"bid_history": ""}}
+    )
+    return len(bids)
+
+def migrate():
+    """
+    Migra tutte le aste che hanno ancora l'array bid_history nel documento.
+    """
+    ensure_indexes()
+    migrated_auctions = 0
+    migrated_bids = 0
+    for auction in auction_collection.find({"bid_history": {"$exists": True}}):
+        migrated_bids += migrate_auction(auction)
+        migrated_auctions += 1
+    print(f"Migrated {migrated_bids} bids from {migrated_auctions} auctions")
+
+if __name__ == "__main__":
+    # Da eseguire prima di avviare il server con BID_STORAGE=collection
+    migrate()
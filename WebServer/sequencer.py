@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+from typing import List, Optional
+from pydantic import BaseModel, model_validator
+
+class BidMessage(BaseModel):
+    bid: int
+    message_id: int
+    sender_id: int
+    vector_clock: List[int]  # Vector clock del mittente, come nel messaggio "bid" del firmware
+    auction_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def sender_in_clock(self):
+        # Un mittente fuori dal vector clock è un messaggio malformato (422), non un errore del server
+        if not 0 <= self.sender_id < len(self.vector_clock):
+            raise ValueError(f"sender_id {self.sender_id} outside the vector clock")
+        return self
+
+class Sequencer:
+    """
+    Sequenziatore lato server per una singola asta, alternativo al nodo 0 del firmware.
+    Consegna le offerte in ordine causale e assegna a ciascuna il prossimo sequence number.
+    Invece di riscandire la hold-back queue a ogni messaggio, le offerte in attesa sono indicizzate:
+    - per (mittente, valore del suo clock), così la consegna di un'offerta trova subito la successiva;
+    - in un heap per il mittente da cui dipendono, ordinato sul valore di clock richiesto.
+    Ogni consegna costa O(log n) nel numero di offerte in attesa (più il confronto del vector clock).
+    """
+
+    def __init__(self):
+        self.vector_clock = []  # Offerte consegnate per mittente
+        self.pending = {}       # (sender_id, clock) -> offerta in attesa
+        self.waiting = {}       # mittente -> heap di (clock richiesto, chiave dell'offerta bloccata)
+        self.sequence_number = 0
+        self.highest_bid = 0
+        self.winner_id = -1
+        self.lock = asyncio.Lock()  # Una richiesta alla volta, dalla consegna alla scrittura degli ordini
+
+    def checkpoint(self):
+        """
+        Copia dello stato, per annullare le consegne se gli ordini assegnati non vengono salvati.
+        """
+        return (list(self.vector_clock), dict(self.pending), {sender: list(heap) for sender, heap in self.waiting.items()},
+                self.sequence_number, self.highest_bid, self.winner_id)
+
+    def rollback(self, state):
+        self.vector_clock, self.pending, self.waiting, self.sequence_number, self.highest_bid, self.winner_id = state
+
+    def restore(self, bids):
+        """
+        Riprende dalle offerte già registrate nell'asta (in ordine di sequence_number), ad esempio dopo un riavvio:
+        ogni offerta consegnata ha incrementato di uno il clock del suo mittente.
+        """
+        for bid in bids:
+            sender_id = bid["sender_id"]
+            if sender_id >= len(self.vector_clock):
+                self.vector_clock.extend([0] * (sender_id + 1 - len(self.vector_clock)))
+            self.vector_clock[sender_id] += 1
+            if bid["bid"] > self.highest_bid:
+                self.highest_bid = bid["bid"]
+                self.winner_id = sender_id
+        self.sequence_number = len(bids)
+
+    def delivered(self, sender_id):
+        return self.vector_clock[sender_id] if sender_id < len(self.vector_clock) else 0
+
+    def submit(self, message):
+        """
+        Registra un'offerta e restituisce i messaggi di ordinamento che ha sbloccato (anche nessuno).
+        I duplicati (stesso mittente e clock) vengono ignorati.
+        """
+        sender_id = message.sender_id
+        if not 0 <= sender_id < len(message.vector_clock):
+            raise ValueError(f"sender_id {sender_id} outside the vector clock")
+        clock = message.vector_clock[sender_id]
+        key = (sender_id, clock)
+        if clock <= self.delivered(sender_id) or key in self.pending:
+            return []
+
+        self.pending[key] = message
+        if clock != self.delivered(sender_id) + 1:
+            # Manca un'offerta precedente dello stesso mittente: la sbloccherà la sua consegna
+            return []
+        return self.process(key)
+
+    def blocking_sender(self, message):
+        """
+        Primo mittente di cui manca un'offerta che precede causalmente message, oppure None.
+        """
+        for index, value in enumerate(message.vector_clock):
+            if index != message.sender_id and value > self.delivered(index):
+                return index
+        return None
+
+    def process(self, key):
+        orders = []
+        ready = [key]
+        while ready:
+            key = ready.pop()
+            message = self.pending[key]
+            blocker = self.blocking_sender(message)
+            if blocker is not None:
+                heapq.heappush(self.waiting.setdefault(blocker, []), (message.vector_clock[blocker], key))
+                continue
+
+            del self.pending[key]
+            orders.append(self.assign(message))
+
+            # Dopo la consegna possono diventare pronte la successiva dello stesso mittente
+            # e le offerte che aspettavano proprio questo valore del suo clock
+            sender_id = message.sender_id
+            delivered = self.vector_clock[sender_id]
+            if (sender_id, delivered + 1) in self.pending:
+                ready.append((sender_id, delivered + 1))
+            waiting = self.waiting.get(sender_id)
+            while waiting and waiting[0][0] <= delivered:
+                ready.append(heapq.heappop(waiting)[1])
+        return orders
+
+    def assign(self, message):
+        """
+        CO Deliver e assegnazione del sequence number, come sendSequencer() del firmware.
+        """
+        sender_id = message.sender_id
+        if sender_id >= len(self.vector_clock):
+            self.vector_clock.extend([0] * (sender_id + 1 - len(self.vector_clock)))
+        self.vector_clock[sender_id] += 1
+
+        if message.bid > self.highest_bid:
+            self.highest_bid = message.bid
+            self.winner_id = sender_id
+        order = {
+            "bid": message.bid,
+            "highest_bid": self.highest_bid,
+            "message_id": message.message_id,
+            "sender_id": sender_id,
+            "winner_id": self.winner_id,
+            "sequence_number": self.sequence_number,
+            "message_type": "order",
+            "auction_id": message.auction_id
+        }
+        self.sequence_number += 1
+        return order
+
+async def sequencer_for(auction, storage):
+    """
+    Sequenziatore dell'asta, creato alla prima offerta. Se l'asta ha già offerte (es. ripresa dopo un riavvio)
+    riparte da quelle salvate nel backend più quelle in memoria non ancora lette, con il lock dell'asta:
+    nessun ordine viene applicato durante la lettura.
+    """
+    if auction.sequencer is None:
+        async with auction.lock:
+            if auction.sequencer is None:
+                sequencer = Sequencer()
+                if auction.has_bids():
+                    bids = await storage.read_bids(auction.auction_id) or []
+                    last = bids[-1]["sequence_number"] if bids else 0
+                    sequencer.restore(bids + [bid for bid in auction.state["bid_history"] if bid["sequence_number"] > last])
+                auction.sequencer = sequencer
+    return auction.sequencer
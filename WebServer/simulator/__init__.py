@@ -0,0 +1,7 @@
+"""
+Simulatore del protocollo sequenziatore/vector clock e generatore di carico per il server.
+Uso: python -m simulator --help (dalla cartella WebServer).
+"""
+from .simulation import AuctionGroup, simulate
+
+__all__ = ["AuctionGroup", "simulate"]
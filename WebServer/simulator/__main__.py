@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import json
+from .link import DEFAULT_URL
+from .simulation import simulate
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog="python -m simulator",
+        description="Simula i nodi dell'asta (sequenziatore + partecipanti) e invia il traffico al server."
+    )
+    parser.add_argument("--nodes", type=int, default=5, help="nodi per asta, sequenziatore compreso")
+    parser.add_argument("--bid-rate", type=float, default=1.0, help="offerte al secondo per nodo")
+    parser.add_argument("--duration", type=float, default=10.0, help="durata di ogni asta in secondi")
+    parser.add_argument("--auctions", type=int, default=1, help="aste in sequenza per gruppo")
+    parser.add_argument("--parallel", type=int, default=1, help="gruppi con aste contemporanee (auction_id espliciti)")
+    parser.add_argument("--auction-id-base", type=int, default=None, help="primo auction_id usato con --parallel")
+    parser.add_argument("--delay-ms", type=float, default=5.0, help="ritardo base della rete")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="ritardo variabile aggiunto a offerte e ordini")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probabilità che un messaggio venga ritardato e sorpassato")
+    parser.add_argument("--reorder-delay-ms", type=float, default=50.0, help="ritardo massimo dei messaggi riordinati")
+    parser.add_argument("--url", default=DEFAULT_URL, help="endpoint /receive-data del server")
+    parser.add_argument("--no-server", action="store_true", help="simula solo il protocollo, senza inviare al server")
+    parser.add_argument("--batch-size", type=int, default=1, help="messaggi per richiesta (>1 usa /receive-data/batch)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="stampa il riepilogo in JSON")
+    return parser.parse_args()
+
+def print_report(report):
+    counters = report["counters"]
+    print(f"Elapsed: {report['elapsed']}s, auctions: {counters.get('auctions', 0)}")
+    print(f"Bids sent: {counters.get('bids_sent', 0)}, orders: {counters.get('orders_sent', 0)}, "
+          f"late bids: {counters.get('late_bids', 0)}, undelivered: {counters.get('undelivered_bids', 0)}")
+    print(f"Requests: {counters.get('requests', 0)}, HTTP errors: {counters.get('http_errors', 0)}")
+    print("Throughput (/s): " + ", ".join(f"{name} {value}" for name, value in report["throughput"].items()))
+    print("Latency (ms):")
+    for name, values in report["latency_ms"].items():
+        print(f"  {name:<12} " + "  ".join(f"{key} {value}" for key, value in values.items()))
+    print("Hold-back queues:")
+    for name, values in report["hold_back"].items():
+        print(f"  {name:<20} max {values['max']}  mean {values['mean']}")
+    diverged = counters.get("diverged_nodes", 0)
+    print("Total order: " + ("consistent" if not diverged else f"{diverged} nodes diverged from the sequencer"))
+
+def main():
+    args = parse_args()
+    report = asyncio.run(simulate(
+        nodes=args.nodes,
+        bid_rate=args.bid_rate,
+        duration=args.duration,
+        auctions=args.auctions,
+        parallel=args.parallel,
+        delay=args.delay_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        reorder=args.reorder,
+        reorder_delay=args.reorder_delay_ms / 1000,
+        url=None if args.no_server else args.url,
+        batch_size=args.batch_size,
+        auction_id_base=args.auction_id_base,
+        seed=args.seed
+    ))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
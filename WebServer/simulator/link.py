@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+try:
+    import httpx
+except ImportError:  # Serve solo per inviare i messaggi a un server reale
+    httpx = None
+
+# Endpoint del server, come serverUrl nel firmware
+DEFAULT_URL = "http://localhost:8000/receive-data"
+
+class ServerLink:
+    """
+    Invia al server i messaggi del sequenziatore (start, order, end), come sendAuctionStateToServer().
+    Un solo worker li invia in ordine; con batch_size > 1 i messaggi accumulati
+    vengono inviati insieme a /receive-data/batch. Senza client i messaggi vengono solo contati.
+    """
+
+    def __init__(self, metrics, client=None, url=DEFAULT_URL, batch_size=1):
+        self.metrics = metrics
+        self.client = client
+        self.url = url
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue()
+
+    def send(self, message, winner_id, auction_id=None):
+        payload = {
+            "bid": message["bid"],
+            "highest_bid": message["highest_bid"],
+            "message_id": message["message_id"],
+            "sender_id": message["sender_id"],
+            "sequence_number": message["sequence_number"],
+            "winner_id": winner_id,
+            "message_type": message["message_type"]
+        }
+        if auction_id is not None:
+            payload["auction_id"] = auction_id
+        self.queue.put_nowait((payload, message["sent_at"]))
+        self.metrics.depth("server_queue", self.queue.qsize())
+
+    async def post(self, payloads):
+        if self.client is None:
+            return True
+        try:
+            if self.batch_size > 1:
+                response = await self.client.post(f"{self.url}/batch", json=payloads)
+            else:
+                response = await self.client.post(self.url, json=payloads[0])
+        except httpx.HTTPError as e:
+            print(f"Error sending to server: {e!r}")
+            return False
+        if response.status_code >= 400:
+            print(f"Server error {response.status_code}: {response.text[:200]}")
+            return False
+        return True
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            started = time.perf_counter()
+            ok = await self.post([payload for payload, _ in batch])
+            finished = time.perf_counter()
+            self.metrics.count("requests")
+            self.metrics.latency("http", finished - started)
+            if not ok:
+                self.metrics.count("http_errors")
+
+            for payload, sent_at in batch:
+                if ok and payload["message_type"] == "order":
+                    self.metrics.count("orders_acked")
+                    # Dalla creazione dell'offerta alla conferma del server
+                    self.metrics.latency("end_to_end", finished - sent_at)
+                self.queue.task_done()
+
+def make_client(url, connections=1):
+    """
+    Client HTTP asincrono; None se non è indicato un server (simulazione del solo protocollo).
+    """
+    if not url:
+        return None
+    if httpx is None:
+        raise RuntimeError("httpx is required to send messages to the server (pip install httpx)")
+    return httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=connections))
@@ -0,0 +1,62 @@
+from collections import defaultdict
+
+# Percentili riportati per ogni misura di latenza
+PERCENTILES = (50, 90, 99)
+
+def percentile(values, p):
+    """
+    Percentile con il metodo nearest-rank su una lista già ordinata.
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+class Metrics:
+    """
+    Contatori, latenze (in secondi) e profondità delle hold-back queue raccolte durante la simulazione.
+    Le profondità tengono solo massimo e media, per non crescere con il numero di messaggi.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self.depths = defaultdict(lambda: [0, 0, 0])  # massimo, somma, campioni
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def latency(self, name, seconds):
+        self.latencies[name].append(seconds)
+
+    def depth(self, name, size):
+        depth = self.depths[name]
+        depth[0] = max(depth[0], size)
+        depth[1] += size
+        depth[2] += 1
+
+    def report(self, elapsed):
+        """
+        Riepilogo serializzabile in JSON: throughput al secondo, latenze in millisecondi, profondità delle code.
+        """
+        latencies = {}
+        for name, values in self.latencies.items():
+            values.sort()
+            latencies[name] = dict(
+                {f"p{p}": round(percentile(values, p) * 1000, 3) for p in PERCENTILES},
+                max=round(values[-1] * 1000, 3),
+                count=len(values)
+            )
+        return {
+            "elapsed": round(elapsed, 3),
+            "counters": dict(self.counters),
+            "throughput": {
+                name: round(self.counters[name] / elapsed, 1) if elapsed else None
+                for name in ("bids_sent", "orders_sent", "orders_acked", "requests")
+            },
+            "latency_ms": latencies,
+            "hold_back": {
+                name: {"max": maximum, "mean": round(total / samples, 2) if samples else 0}
+                for name, (maximum, total, samples) in self.depths.items()
+            }
+        }
@@ -0,0 +1,42 @@
+import asyncio
+
+class Network:
+    """
+    Broadcast ESP-NOW simulato: ogni messaggio arriva agli altri nodi dopo un ritardo.
+    Offerte e ordini hanno un ritardo variabile per destinatario (jitter) e, con probabilità reorder,
+    un ritardo aggiuntivo che li fa sorpassare dai messaggi successivi.
+    start/end arrivano a tutti dopo il solo ritardo base, come un unico frame broadcast.
+    """
+
+    def __init__(self, rng, delay=0.005, jitter=0.005, reorder=0.0, reorder_delay=0.05):
+        self.rng = rng
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.nodes = []
+        self.in_flight = 0
+
+    def broadcast(self, sender, message):
+        loop = asyncio.get_running_loop()
+        for node in self.nodes:
+            if node is sender:
+                continue
+            delay = self.delay
+            if message["message_type"] in ("bid", "order"):
+                delay += self.rng.uniform(0, self.jitter)
+                if self.rng.random() < self.reorder:
+                    delay += self.rng.uniform(0, self.reorder_delay)
+            self.in_flight += 1
+            loop.call_later(delay, self.deliver, node, message)
+
+    def deliver(self, node, message):
+        self.in_flight -= 1
+        node.receive(message)
+
+    async def drain(self):
+        """
+        Attende che tutti i messaggi in viaggio siano stati consegnati.
+        """
+        while self.in_flight:
+            await asyncio.sleep(self.delay or 0.001)
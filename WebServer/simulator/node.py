@@ -0,0 +1,208 @@
+import time
+
+class Node:
+    """
+    Partecipante virtuale, riscrittura del protocollo di Sequenziatore.ino.
+    Ordinamento causale con vector clock (holdBackQueuePart) e ordinamento totale
+    con i messaggi "order" del sequenziatore (holdBackQueueCausal / holdBackQueueOrder).
+    """
+
+    def __init__(self, node_id, num_nodes, network, metrics):
+        self.node_id = node_id
+        self.num_nodes = num_nodes
+        self.network = network
+        self.metrics = metrics
+        self.reset()
+
+    def reset(self):
+        """
+        Azzera lo stato del nodo, come startAuction() del firmware.
+        """
+        self.vector_clock = [0] * self.num_nodes
+        self.message_id = 0
+        self.sequence_number = 0
+        self.highest_bid = 0
+        self.winner_id = -1
+        self.auction_started = False
+        self.hold_back = []  # Offerte in attesa della causalità
+        self.causal = {}     # (sender_id, message_id) -> offerta causale in attesa dell'ordinamento
+        self.orders = {}     # sequence_number -> messaggio di ordinamento in attesa dell'offerta
+        self.delivered = []  # (sender_id, message_id) nell'ordine totale
+
+    def make_bid(self):
+        """
+        Costruisce un'offerta pari alla più alta conosciuta + 1, come triggerSendBid().
+        """
+        self.message_id += 1
+        vector_clock = list(self.vector_clock)
+        vector_clock[self.node_id] += 1
+        return {
+            "message_type": "bid",
+            "bid": self.highest_bid + 1,
+            "highest_bid": 0,
+            "message_id": self.message_id,
+            "sender_id": self.node_id,
+            "sequence_number": 0,
+            "vector_clock": vector_clock,
+            "sent_at": time.perf_counter()
+        }
+
+    def send_bid(self):
+        """
+        Invia un'offerta a tutti e la riceve anche localmente, come sendBid().
+        """
+        message = self.make_bid()
+        self.metrics.count("bids_sent")
+        self.network.broadcast(self, message)
+        self.receive(message)
+
+    def receive(self, message):
+        """
+        Gestisce un messaggio ricevuto, come onDataReceive() per i partecipanti.
+        """
+        message_type = message["message_type"]
+        if message_type == "bid":
+            self.hold_back.append(message)
+            self.metrics.depth("hold_back", len(self.hold_back))
+            self.process_hold_back()
+
+        elif message_type == "order":
+            self.orders[message["sequence_number"]] = message
+            self.metrics.depth("order", len(self.orders))
+            self.deliver_ordered()
+
+        elif message_type == "start":
+            self.reset()
+            self.auction_started = True
+
+        elif message_type == "end":
+            self.auction_started = False
+
+    def is_causal(self, message):
+        """
+        Condizioni di causalità di causalControl() e isCausallyRead().
+        """
+        sender_id = message["sender_id"]
+        vector_clock = message["vector_clock"]
+        if vector_clock[sender_id] != self.vector_clock[sender_id] + 1:
+            return False
+        return all(
+            value <= self.vector_clock[index]
+            for index, value in enumerate(vector_clock) if index != sender_id
+        )
+
+    def process_hold_back(self):
+        """
+        Consegna le offerte diventate causali; ogni consegna può sbloccarne altre, quindi si ricomincia.
+        """
+        progress = True
+        while progress:
+            progress = False
+            for index, message in enumerate(self.hold_back):
+                if self.is_causal(message):
+                    del self.hold_back[index]
+                    self.co_deliver(message)
+                    progress = True
+                    break
+
+    def co_deliver(self, message):
+        """
+        CO Deliver: aggiorna il vector clock e attende il messaggio di ordinamento.
+        """
+        self.vector_clock[message["sender_id"]] += 1
+        self.causal[(message["sender_id"], message["message_id"])] = message
+        self.metrics.depth("causal", len(self.causal))
+        self.deliver_ordered()
+
+    def deliver_ordered(self):
+        """
+        TO Deliver di tutte le offerte che hanno sia la causalità sia il prossimo sequence number.
+        """
+        while self.sequence_number in self.orders:
+            order = self.orders[self.sequence_number]
+            key = (order["sender_id"], order["message_id"])
+            if key not in self.causal:
+                break
+            del self.orders[self.sequence_number]
+            del self.causal[key]
+            self.to_deliver(order)
+
+    def to_deliver(self, message):
+        self.sequence_number += 1
+        if message["bid"] > self.highest_bid:
+            self.highest_bid = message["bid"]
+            self.winner_id = message["sender_id"]
+        self.delivered.append((message["sender_id"], message["message_id"]))
+        self.metrics.latency("delivery", time.perf_counter() - message["sent_at"])
+
+class Sequencer(Node):
+    """
+    Nodo 0: partecipa all'asta e assegna l'ordine totale alle offerte causali (holdBackQueueSeq, sendSequencer()).
+    I messaggi verso il server passano da link, nell'ordine in cui vengono prodotti.
+    """
+
+    def __init__(self, node_id, num_nodes, network, metrics, link):
+        super().__init__(node_id, num_nodes, network, metrics)
+        self.link = link
+        self.auction_id = None
+
+    def receive(self, message):
+        # Il sequenziatore ignora order/start/end: è lui a generarli
+        if message["message_type"] != "bid":
+            return
+        if not self.auction_started:
+            # Offerta arrivata dopo la fine dell'asta
+            self.metrics.count("late_bids")
+            return
+        self.hold_back.append(message)
+        self.metrics.depth("sequencer_hold_back", len(self.hold_back))
+        self.process_hold_back()
+
+    def co_deliver(self, message):
+        """
+        CO Deliver del sequenziatore: aggiorna il vector clock e invia subito l'ordinamento.
+        """
+        self.vector_clock[message["sender_id"]] += 1
+        self.send_order(message)
+
+    def send_order(self, message):
+        if message["bid"] > self.highest_bid:
+            self.highest_bid = message["bid"]
+            self.winner_id = message["sender_id"]
+        order = dict(message, message_type="order", sequence_number=self.sequence_number, highest_bid=self.highest_bid)
+        self.sequence_number += 1
+        self.delivered.append((message["sender_id"], message["message_id"]))
+        self.metrics.count("orders_sent")
+        self.network.broadcast(self, order)
+        self.link.send(order, self.winner_id, self.auction_id)
+
+    def control_message(self, message_type):
+        return {
+            "message_type": message_type,
+            "bid": 0,
+            "highest_bid": self.highest_bid,
+            "message_id": 0,
+            "sender_id": self.node_id,
+            "sequence_number": 0,
+            "sent_at": time.perf_counter()
+        }
+
+    def start_auction(self, auction_id=None):
+        """
+        Avvia l'asta: azzera lo stato e invia "start" ai partecipanti e al server.
+        """
+        self.reset()
+        self.auction_id = auction_id
+        self.auction_started = True
+        message = self.control_message("start")
+        self.network.broadcast(self, message)
+        self.link.send(message, self.winner_id, auction_id)
+
+    def end_auction(self):
+        """
+        Termina l'asta, come checkEndAuction(); le offerte arrivate dopo non vengono più ordinate.
+        """
+        self.auction_started = False
+        message = self.control_message("end")
+        self.network.broadcast(self, message)
+        self.link.send(message, self.winner_id, self.auction_id)
@@ -0,0 +1,95 @@
+import asyncio
+import random
+import time
+from .link import DEFAULT_URL, ServerLink, make_client
+from .metrics import Metrics
+from .network import Network
+from .node import Node, Sequencer
+
+class AuctionGroup:
+    """
+    Un sequenziatore e i suoi partecipanti che svolgono una serie di aste.
+    Con più gruppi in parallelo ogni gruppo usa auction_id espliciti.
+    """
+
+    def __init__(self, num_nodes, metrics, rng, link, **network_options):
+        self.metrics = metrics
+        self.rng = rng
+        self.link = link
+        self.network = Network(rng, **network_options)
+        self.sequencer = Sequencer(0, num_nodes, self.network, metrics, link)
+        self.nodes = [self.sequencer] + [
+            Node(node_id, num_nodes, self.network, metrics) for node_id in range(1, num_nodes)
+        ]
+        self.network.nodes = self.nodes
+
+    async def bidder(self, node, bid_rate):
+        # Offerte con arrivi di Poisson, solo ad asta avviata (come il bottone del firmware)
+        while True:
+            await asyncio.sleep(self.rng.expovariate(bid_rate))
+            if node.auction_started:
+                node.send_bid()
+
+    def check_consistency(self):
+        """
+        Conta i nodi che hanno consegnato le offerte in un ordine diverso dal sequenziatore.
+        """
+        expected = self.sequencer.delivered
+        diverged = sum(1 for node in self.nodes[1:] if node.delivered != expected)
+        self.metrics.count("diverged_nodes", diverged)
+        # Offerte rimaste nelle code a fine asta (es. arrivate al sequenziatore dopo "end")
+        self.metrics.count("undelivered_bids", sum(len(node.hold_back) + len(node.causal) for node in self.nodes[1:]))
+
+    async def run(self, auction_ids, duration, bid_rate):
+        worker = asyncio.create_task(self.link.run())
+        bidders = [asyncio.create_task(self.bidder(node, bid_rate)) for node in self.nodes]
+        try:
+            for auction_id in auction_ids:
+                self.sequencer.start_auction(auction_id)
+                await asyncio.sleep(duration)
+                self.sequencer.end_auction()
+                await self.network.drain()
+                await self.link.queue.join()
+                self.check_consistency()
+                self.metrics.count("auctions")
+        finally:
+            for task in bidders + [worker]:
+                task.cancel()
+            await asyncio.gather(*bidders, worker, return_exceptions=True)
+
+async def simulate(nodes=5, bid_rate=1.0, duration=10.0, auctions=1, parallel=1,
+                   delay=0.005, jitter=0.005, reorder=0.0, reorder_delay=0.05,
+                   url=DEFAULT_URL, batch_size=1, auction_id_base=None, seed=None):
+    """
+    Esegue la simulazione e restituisce il riepilogo delle metriche (vedi Metrics.report).
+    Con parallel > 1 i gruppi inviano auction_id espliciti a partire da auction_id_base.
+    """
+    rng = random.Random(seed)
+    metrics = Metrics()
+    client = make_client(url, connections=parallel)
+    if parallel > 1 and auction_id_base is None:
+        # Id alti per non scontrarsi con quelli generati dal contatore del server
+        auction_id_base = int(time.time())
+
+    groups = []
+    for group in range(parallel):
+        link = ServerLink(metrics, client, url, batch_size)
+        groups.append(AuctionGroup(
+            nodes, metrics, random.Random(rng.random()), link,
+            delay=delay, jitter=jitter, reorder=reorder, reorder_delay=reorder_delay
+        ))
+
+    def auction_ids(group):
+        if parallel == 1:
+            return [None] * auctions
+        return [auction_id_base + group * auctions + index for index in range(auctions)]
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            group.run(auction_ids(index), duration, bid_rate) for index, group in enumerate(groups)
+        ))
+    finally:
+        if client is not None:
+            await client.aclose()
+    return metrics.report(time.perf_counter() - started)
@@ -1,37 +1,95 @@
 document.addEventListener("DOMContentLoaded", () => {
-    function updateDashboard() {
-        // Aggiorna stato asta
-        fetch('/auction_state')
-            .then(response => response.json())
-            .then(data => {
-                const statusElement = document.getElementById('auction-status');
-                statusElement.textContent = data.is_active ? 'ATTIVA' : 'INATTIVA';
-                statusElement.className = 'status ' + (data.is_active ? 'active' : 'inactive');
-
-                document.getElementById('highest-bid').textContent = data.highest_bid;
-                document.getElementById('winner-id').textContent =
-                    data.winner_id === -1 ? '-' : data.winner_id;
-            });
-
-        // Aggiorna cronologia offerte
-        fetch('/bids_history')
-            .then(response => response.json())
-            .then(data => {
-                const historyDiv = document.getElementById('bid-history');
-                // Popola la cronologia delle offerte
-                historyDiv.innerHTML = data.map(bid => `
-                    <div class="bid-entry">
-                        <strong>Nodo ${bid.sender_id}</strong> ha offerto ${bid.bid}
-                        <br>
-                    </div>
-                `).join('');
-
-                // Scorri automaticamente verso il basso
-                historyDiv.scrollTop = historyDiv.scrollHeight;
-            });
+    const historyDiv = document.getElementById('bid-history');
+    const PAGE_SIZE = 500;
+    let lastSequence = null;
+    let syncing = false;
+    let pendingBids = [];
+
+    function updateStatus(data) {
+        // Aggiorna stato asta (gli eventi "order" non contengono is_active)
+        if (data.is_active !== undefined) {
+            const statusElement = document.getElementById('auction-status');
+            statusElement.textContent = data.is_active ? 'ATTIVA' : 'INATTIVA';
+            statusElement.className = 'status ' + (data.is_active ? 'active' : 'inactive');
+        }
+
+        document.getElementById('highest-bid').textContent = data.highest_bid;
+        document.getElementById('winner-id').textContent =
+            data.winner_id === -1 ? '-' : data.winner_id;
+    }
+
+    function clearHistory() {
+        historyDiv.innerHTML = '';
+        lastSequence = null;
+    }
+
+    function appendBids(bids) {
+        // Aggiunge solo le offerte nuove, scartando quelle già mostrate
+        const newBids = bids.filter(bid => lastSequence === null || bid.sequence_number > lastSequence);
+        if (newBids.length === 0) return;
+
+        historyDiv.insertAdjacentHTML('beforeend', newBids.map(bid => `
+            <div class="bid-entry">
+                <strong>Nodo ${bid.sender_id}</strong> ha offerto ${bid.bid}
+                <br>
+            </div>
+        `).join(''));
+        lastSequence = newBids[newBids.length - 1].sequence_number;
+
+        // Scorri automaticamente verso il basso
+        historyDiv.scrollTop = historyDiv.scrollHeight;
+    }
+
+    async function loadHistory() {
+        // Legge lo storico a pagine usando il sequence_number dell'ultima offerta come cursore
+        syncing = true;
+        try {
+            while (true) {
+                const cursor = lastSequence === null ? '' : `&since_sequence=${lastSequence}`;
+                const response = await fetch(`/bids_history?limit=${PAGE_SIZE}${cursor}`);
+                const bids = await response.json();
+                if (!Array.isArray(bids) || bids.length === 0) break;
+                appendBids(bids);
+                if (bids.length < PAGE_SIZE) break;
+            }
+        } catch (error) {
+            console.error('Error fetching bid history:', error);
+        } finally {
+            // Le offerte arrivate durante la lettura vengono aggiunte dopo lo storico
+            syncing = false;
+            appendBids(pendingBids);
+            pendingBids = [];
+        }
     }
 
-    // Aggiorna ogni secondo
-    setInterval(updateDashboard, 1000);
-    updateDashboard();
+    // Il server invia un'istantanea (senza storico) alla connessione e poi solo gli eventi nuovi;
+    // in caso di errore EventSource si riconnette da solo e riceve una nuova istantanea
+    const source = new EventSource('/events');
+
+    source.addEventListener('snapshot', event => {
+        clearHistory();
+        pendingBids = [];
+        updateStatus(JSON.parse(event.data));
+        loadHistory();
+    });
+
+    source.addEventListener('start', event => {
+        clearHistory();
+        pendingBids = [];
+        updateStatus(JSON.parse(event.data));
+    });
+
+    source.addEventListener('order', event => {
+        const bid = JSON.parse(event.data);
+        updateStatus(bid);
+        if (syncing) {
+            pendingBids.push(bid);
+        } else {
+            appendBids([bid]);
+        }
+    });
+
+    source.addEventListener('end', event => {
+        updateStatus(JSON.parse(event.data));
+    });
 });
@@ -1,9 +1,12 @@
-let allAuctions = [];
+let allAuctions = [];                // Riepiloghi delle aste (senza storico), per selettore e conteggi
+const auctionDetails = new Map();    // Aste complete ricevute in streaming, per auction_id
+const PAGE_SIZE = 200;
 
 async function initialize() {
     try {
         await fetchAuctions();
         await fetchAndDisplayStatistics();
+        await streamAuctionDetails();
     } catch (error) {
         console.error('Initialization error:', error);
         showError('Failed to initialize the page. Please refresh to try again.');
@@ -12,21 +15,60 @@ async function initialize() {
 
 async function fetchAuctions() {
     try {
-        const response = await fetch('/all_auctions');
-        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        // Legge solo i riepiloghi, a pagine, usando l'ultimo auction_id come cursore
+        allAuctions = [];
+        let afterId = null;
+        do {
+            const cursor = afterId === null ? '' : `&after_id=${afterId}`;
+            const response = await fetch(`/all_auctions?fields=summary&limit=${PAGE_SIZE}${cursor}`);
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+
+            const data = await response.json();
+            if (!data || !data.auctions) throw new Error('Invalid data format received');
 
-        const data = await response.json();
-        if (!data || !data.auctions) throw new Error('Invalid data format received');
+            allAuctions.push(...data.auctions);
+            afterId = data.next_after_id;
+        } while (afterId !== null);
 
-        allAuctions = data.auctions;
         updateAuctionSelector();
-        displayAuctions(allAuctions);
     } catch (error) {
         console.error('Error fetching auctions:', error);
         showError('Failed to load auctions');
     }
 }
 
+async function streamAuctionDetails() {
+    // Riceve le aste complete una per riga (NDJSON) e mostra le card man mano che arrivano
+    try {
+        const response = await fetch('/all_auctions/stream');
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        document.getElementById('auctions-container').innerHTML = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            const auctions = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+            auctions.forEach(auction => auctionDetails.set(auction.auction_id.toString(), auction));
+
+            const selected = document.getElementById('auctionSelect').value;
+            appendAuctionCards(selected === 'all' ? auctions : auctions.filter(a => a.auction_id.toString() === selected));
+        }
+
+        if (auctionDetails.size === 0) displayAuctions([]);
+    } catch (error) {
+        console.error('Error streaming auctions:', error);
+        showError('Failed to load auctions');
+    }
+}
+
 function updateAuctionSelector() {
     const selector = document.getElementById('auctionSelect');
     selector.innerHTML = '<option value="all">All Auctions</option>';
@@ -40,9 +82,9 @@ function updateAuctionSelector() {
 
     selector.addEventListener('change', (e) => {
         if (e.target.value === 'all') {
-            displayAuctions(allAuctions);
+            displayAuctions(Array.from(auctionDetails.values()));
         } else {
-            const selectedAuction = allAuctions.find(a => a.auction_id.toString() === e.target.value);
+            const selectedAuction = auctionDetails.get(e.target.value);
             displayAuctions(selectedAuction ? [selectedAuction] : []);
         }
     });
@@ -57,6 +99,12 @@ function displayAuctions(auctions) {
         return;
     }
 
+    appendAuctionCards(auctions);
+}
+
+function appendAuctionCards(auctions) {
+    const container = document.getElementById('auctions-container');
+
     auctions.forEach(auction => {
         const card = document.createElement('div');
         card.className = 'auction-card';
@@ -79,58 +127,74 @@ function displayAuctions(auctions) {
     });
 }
 
-async function fetchAndDisplayStatistics() {
-    try {
-        const response = await fetch('/auction_stats');
-        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+const SERIES_POINTS = 100;  // Punti dei grafici: il server riduce le serie più lunghe
 
-        const stats = await response.json();
+async function fetchJson(url) {
+    const response = await fetch(url);
+    if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+    return response.json();
+}
 
-        // Display line charts only for averages
-        createLineChart('avgWinningBidChart', 'Average Winning Bid Over Time', stats.average_winning_bid || 0);
-        createLineChart('avgBidsPerAuctionChart', 'Average Bids Per Auction Over Time', stats.average_bids_per_auction || 0);
+async function fetchAndDisplayStatistics() {
+    try {
+        const stats = await fetchJson('/auction_stats');
 
         // Display simple values for max and min
         displaySimpleValue('maxWinningBidChart', 'Maximum Winning Bid', stats.max_winning_bid || 0);
         displaySimpleValue('minWinningBidChart', 'Minimum Winning Bid', stats.min_winning_bid || 0);
-
     } catch (error) {
         console.error('Error fetching statistics:', error);
         showError('Failed to load statistics');
     }
+
+    try {
+        // Serie reali calcolate dal server sulle aste concluse
+        const [winningBids, bidsPerAuction, increments, senders, interArrival] = await Promise.all([
+            fetchJson(`/auction_stats/series/winning_bid?points=${SERIES_POINTS}`),
+            fetchJson(`/auction_stats/series/bids_per_auction?points=${SERIES_POINTS}`),
+            fetchJson(`/auction_stats/series/bid_increment?points=${SERIES_POINTS}`),
+            fetchJson('/auction_stats/senders?limit=10'),
+            fetchJson('/auction_stats/inter_arrival')
+        ]);
+
+        createLineChart('avgWinningBidChart', 'Winning Bid per Auction', winningBids);
+        createLineChart('avgBidsPerAuctionChart', 'Bids per Auction', bidsPerAuction);
+        createLineChart('bidIncrementChart', 'Average Bid Increment', increments);
+        createSendersChart('senderWinRateChart', senders);
+        displayInterArrival('interArrivalCard', interArrival);
+    } catch (error) {
+        console.error('Error fetching bid analytics:', error);
+        showError('Failed to load bid analytics');
+    }
 }
 
-function createLineChart(canvasId, label, currentValue) {
+function createLineChart(canvasId, label, series) {
     const ctx = document.getElementById(canvasId);
     if (!ctx) return;
 
-    // Genera le etichette basate sul numero di aste invece dei mesi
-    const numAuctions = allAuctions.length;
-    const labels = Array.from({length: 12}, (_, i) =>
-        Math.round((i + 1) * (numAuctions / 12)).toString()
-    );
-
-    // Genera valori che mostrano un trend verso il valore corrente
-    const values = Array.from({length: 12}, (_, i) => {
-        const progress = i / 11;
-        const baseValue = currentValue * 0.7;
-        const increment = (currentValue - baseValue) * progress;
-        return baseValue + increment + (Math.random() - 0.5) * (currentValue * 0.1);
-    });
-    values[values.length - 1] = currentValue;
+    // Con una serie ridotta ogni punto è un intervallo di aste: la media come linea, minimo e massimo come banda
+    const reduced = series.x.length < series.count;
+    const datasets = [{
+        label: label,
+        data: series.mean,
+        borderColor: 'rgb(0, 102, 255)',
+        backgroundColor: 'rgba(0, 102, 255, 0.1)',
+        tension: 0.4,
+        spanGaps: true,
+        fill: !reduced
+    }];
+    if (reduced) {
+        datasets.push(
+            { label: 'Max', data: series.max, borderWidth: 0, pointRadius: 0, spanGaps: true, backgroundColor: 'rgba(0, 102, 255, 0.1)', fill: '+1' },
+            { label: 'Min', data: series.min, borderWidth: 0, pointRadius: 0, spanGaps: true }
+        );
+    }
 
     new Chart(ctx, {
         type: 'line',
         data: {
-            labels: labels,
-            datasets: [{
-                label: label,
-                data: values,
-                borderColor: 'rgb(0, 102, 255)',
-                backgroundColor: 'rgba(0, 102, 255, 0.1)',
-                tension: 0.4,
-                fill: true
-            }]
+            labels: series.x.map(auctionId => auctionId.toString()),
+            datasets: datasets
         },
         options: {
             responsive: true,
@@ -166,7 +230,7 @@ function createLineChart(canvasId, label, currentValue) {
                     },
                     title: {
                         display: true,
-                        text: 'Number of Auctions',
+                        text: 'Auction',
                         font: {
                             size: 14
                         }
@@ -177,6 +241,60 @@ function createLineChart(canvasId, label, currentValue) {
     });
 }
 
+function createSendersChart(canvasId, data) {
+    const ctx = document.getElementById(canvasId);
+    if (!ctx) return;
+
+    new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: data.senders.map(sender => `User ${sender.sender_id}`),
+            datasets: [{
+                label: 'Win Rate (%)',
+                data: data.senders.map(sender => sender.win_rate * 100),
+                backgroundColor: 'rgba(0, 102, 255, 0.6)'
+            }]
+        },
+        options: {
+            responsive: true,
+            plugins: {
+                legend: {
+                    display: false
+                },
+                tooltip: {
+                    callbacks: {
+                        // Aste vinte su aste a cui il mittente ha partecipato
+                        afterLabel: (item) => {
+                            const sender = data.senders[item.dataIndex];
+                            return `${sender.wins} of ${sender.auctions} auctions`;
+                        }
+                    }
+                }
+            },
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    max: 100
+                }
+            }
+        }
+    });
+}
+
+function displayInterArrival(containerId, interArrival) {
+    const container = document.getElementById(containerId);
+    if (!container) return;
+
+    const format = (seconds) => seconds === null ? '-' : `${(seconds * 1000).toFixed(0)} ms`;
+    container.innerHTML = `
+        <div class="simple-value-display">
+            <h3>Time Between Bids</h3>
+            <div class="value">${format(interArrival.p50)}</div>
+            <p>p90 ${format(interArrival.p90)} &middot; p99 ${format(interArrival.p99)}</p>
+        </div>
+    `;
+}
+
 function displaySimpleValue(containerId, label, value) {
     const container = document.getElementById(containerId);
     if (!container) return;
@@ -196,22 +314,6 @@ function displaySimpleValue(containerId, label, value) {
 }
 
 
-function generateTrendData(currentValue) {
-    const numberOfPoints = 10;
-    const labels = Array.from({length: numberOfPoints}, (_, i) => `Point ${i + 1}`);
-
-    // Genera valori che fluttuano intorno al valore corrente
-    const values = Array.from({length: numberOfPoints}, () => {
-        const variation = (Math.random() - 0.5) * (currentValue * 0.2);
-        return currentValue + variation;
-    });
-
-    // Assicurati che l'ultimo valore sia esattamente quello corrente
-    values[values.length - 1] = currentValue;
-
-    return { labels, values };
-}
-
 function showError(message) {
     const errorDiv = document.createElement('div');
     errorDiv.className = 'error-message';
@@ -0,0 +1,99 @@
+from db import auction_collection, stats_collection
+
+# Documento riassuntivo delle statistiche, aggiornato in modo incrementale
+STATS_ID = "auction_stats"
+
+def record_auction_started():
+    """
+    Aggiorna il riepilogo all'avvio di una nuova asta.
+    """
+    stats_collection.update_one(
+        {"_id": STATS_ID},
+        {"$inc": {"total_active_auctions": 1}},
+        upsert=True
+    )
+
+def record_auction_ended(highest_bid, num_bids, was_active=True):
+    """
+    Aggiorna il riepilogo alla chiusura di un'asta con l'offerta vincente e il numero di offerte.
+    was_active è False quando l'asta viene salvata direttamente come conclusa.
+    """
+    stats_collection.update_one(
+        {"_id": STATS_ID},
+        {
+            "$inc": {
+                "total_active_auctions": -1 if was_active else 0,
+                "total_concluded_auctions": 1,
+                "sum_winning_bid": highest_bid,
+                "total_bids": num_bids
+            },
+            "$min": {"min_winning_bid": highest_bid},
+            "$max": {"max_winning_bid": highest_bid}
+        },
+        upsert=True
+    )
+
+def read_stats():
+    """
+    Restituisce le statistiche leggendo solo il documento riassuntivo.
+    """
+    return summary_view(stats_collection.find_one({"_id": STATS_ID}) or {})
+
+def summary_view(summary):
+    """
+    Statistiche restituite da /auction_stats a partire dal documento riassuntivo.
+    """
+    concluded = summary.get("total_concluded_auctions", 0)
+    return {
+        "average_winning_bid": summary.get("sum_winning_bid", 0) / concluded if concluded else 0,
+        "average_bids_per_auction": summary.get("total_bids", 0) / concluded if concluded else 0,
+        "max_winning_bid": summary.get("max_winning_bid", 0),
+        "min_winning_bid": summary.get("min_winning_bid", 0),
+        "total_active_auctions": summary.get("total_active_auctions", 0),
+        "total_concluded_auctions": concluded
+    }
+
+def rebuild_stats():
+    """
+    Ricalcola da zero il riepilogo con un unico passaggio $facet sulla collezione delle aste.
+    """
+    result = list(auction_collection.aggregate([
+        {"$facet": {
+            "concluded": [
+                {"$match": {"is_active": False}},  # Solo aste concluse
+                {"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "sum_winning_bid": {"$sum": "$highest_bid"},
+                    "min_winning_bid": {"$min": "$highest_bid"},
+                    "max_winning_bid": {"$max": "$highest_bid"},
+                    # Offerte salvate a parte (bid_count) oppure nell'array bid_history
+                    "total_bids": {"$sum": {"$ifNull": ["$bid_count", {"$size": {"$ifNull": ["$bid_history", []]}}]}}
+                }}
+            ],
+            "active": [
+                {"$match": {"is_active": True}},
+                {"$count": "count"}
+            ]
+        }}
+    ]))[0]
+
+    summary = {"_id": STATS_ID, "total_active_auctions": result["active"][0]["count"] if result["active"] else 0}
+    if result["concluded"] and result["concluded"][0]["count"]:
+        concluded = result["concluded"][0]
+        summary["total_concluded_auctions"] = concluded["count"]
+        summary["sum_winning_bid"] = concluded["sum_winning_bid"]
+        summary["total_bids"] = concluded["total_bids"]
+        # null è minore di qualsiasi numero per $min: i campi vuoti non vanno salvati
+        for field in ("min_winning_bid", "max_winning_bid"):
+            if concluded[field] is not None:
+                summary[field] = concluded[field]
+    stats_collection.replace_one({"_id": STATS_ID}, summary, upsert=True)
+    return read_stats()
+
+def ensure_stats():
+    """
+    Crea il riepilogo dallo storico esistente se non è ancora presente.
+    """
+    if not stats_collection.find_one({"_id": STATS_ID}):
+        rebuild_stats()
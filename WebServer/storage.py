@@ -0,0 +1,481 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from pymongo.errors import DuplicateKeyError
+from bids import (AUCTIONS_PAGE, MAX_AUCTIONS_PAGE, SUMMARY_PROJECTION, bid_fields, find_auctions, load_active_bid_history,
+                  load_all_auctions, load_message_watermarks, replace_bids, slice_bid_history, with_bid_history)
+from db import auction_collection, close, database_fingerprint, ensure_counters, ensure_indexes, get_next_sequence_value, run_db
+from eventlog import EventLog, MongoEventLog, end_event, insert_events, insert_snapshots, order_events, start_event
+from journal import flush, recover, write_bids
+from stats import ensure_stats, read_stats, rebuild_stats, record_auction_ended, record_auction_started, summary_view
+
+# Dove vengono salvate le aste:
+# "memory"         solo in memoria, nessuna connessione a MongoDB (tutto si perde all'arresto)
+# "write_through"  ogni offerta viene scritta subito su MongoDB (o nel journal, vedi journal.py)
+# "persist_on_end" l'asta resta in memoria e viene salvata su MongoDB con un solo inserimento alla chiusura
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "write_through")
+
+# Contatori di un'asta già salvati, letti per riprenderla (o riconoscere un "end" ripetuto)
+STORED_FIELDS = {"_id": 0, "auction_id": 1, "highest_bid": 1, "winner_id": 1, "sequence_number": 1}
+
+def new_document(auction_id, default=False):
+    """
+    Documento di una nuova asta, con la stessa forma usata su MongoDB.
+    default indica un'asta avviata senza auction_id, da riprendere per i messaggi che non lo indicano.
+    """
+    return {
+        "auction_id": auction_id,
+        "is_active": True,
+        "default": default,
+        "highest_bid": 0,
+        "winner_id": -1,
+        "sequence_number": 0,
+        "bid_history": []
+    }
+
+def stored_fields(document):
+    return {field: document[field] for field in STORED_FIELDS if field != "_id"}
+
+def persisted(document):
+    """
+    Documento da salvare su MongoDB, con le offerte nel documento o nella collezione bids secondo BID_STORAGE.
+    """
+    fields = {key: value for key, value in document.items() if key != "bid_history"}
+    return dict(fields, **bid_fields(document["bid_history"]))
+
+def summary_document(document):
+    """
+    Asta senza storico, con il solo numero di offerte (come fields=summary su MongoDB).
+    """
+    summary = {field: document[field] for field, value in SUMMARY_PROJECTION.items() if value == 1}
+    return dict(summary, bid_count=len(document["bid_history"]))
+
+class AuctionExists(Exception):
+    """
+    auction_id già usato da un'altra asta (indice unico su MongoDB).
+    """
+
+class Storage(ABC):
+    """
+    Backend di persistenza dell'app. Le aste attive vivono sempre in memoria (vedi AuctionEngine):
+    il backend decide cosa salvare e quando, e risponde per le aste che in memoria non ci sono.
+    Tutti i metodi sono coroutine chiamate dall'event loop; open e close dal lifespan dell'app.
+    """
+
+    name = None
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def next_auction_id(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, auction_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def auction_started(self, auction_id, default=False):
+        """
+        Nuova asta attiva (default: avviata senza auction_id); solleva AuctionExists se l'auction_id è già stato usato.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bids_added(self, auction_id, new_bids, fields):
+        """
+        Nuove offerte di un'asta (new_bids, con il sequence_number assegnato dal server) e i suoi contatori aggiornati.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def auction_ended(self, auction, highest_bid, winner_id):
+        """
+        Chiusura di un'asta con il risultato del messaggio "end", chiamata con il lock dell'asta prima di
+        aggiornare lo stato in memoria: quando termina l'asta risulta conclusa anche per il backend.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_active(self, auction_id=None):
+        """
+        Contatori e watermark dei mittenti di un'asta attiva (senza auction_id: la predefinita più recente) per riprenderla, oppure None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_ended(self, auction_id):
+        """
+        Contatori di un'asta già conclusa, oppure None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read_auction(self, auction_id):
+        """
+        Documento completo di un'asta, storico compreso, oppure None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read_bids(self, auction_id, since_sequence=None, limit=None):
+        """
+        Offerte di un'asta successive a since_sequence, al massimo limit, oppure None se l'asta non esiste.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def state_at(self, auction_id, at_sequence=None):
+        """
+        Stato di un'asta al sequence_number at_sequence, ricostruito dal log degli eventi, oppure None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def all_auctions(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_auctions(self, fields="full", after_id=None, limit=AUCTIONS_PAGE):
+        """
+        Pagina di aste ordinate per auction_id successive ad after_id; fields="summary" esclude lo storico.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stats(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rebuild_stats(self):
+        raise NotImplementedError
+
+    async def fingerprint(self):
+        """
+        Identifica il database delle aste salvate per le cache su file (vedi analytics.py),
+        oppure None se le aste non sopravvivono al processo.
+        """
+        return None
+
+    async def stream_auctions(self, fields="full"):
+        """
+        Generatore NDJSON (un'asta per riga) che legge le aste una pagina alla volta:
+        la memoria del server resta costante e il primo byte parte subito, qualunque sia lo storico.
+        """
+        after_id = None
+        while True:
+            page = await self.find_auctions(fields, after_id, AUCTIONS_PAGE)
+            for auction in page:
+                yield json.dumps(auction) + "\n"
+            if len(page) < AUCTIONS_PAGE:
+                break
+            after_id = page[-1]["auction_id"]
+
+class MemoryStorage(Storage):
+    """
+    Nessuna persistenza: le aste, anche concluse, restano in memoria fino all'arresto del processo.
+    Il backend più economico, per prove, benchmark e installazioni in cui lo storico non serve.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.auctions = {}          # auction_id -> documento, con la stessa forma di quelli su MongoDB
+        self.last_auction_id = 0
+        self.summary = {}           # Riepilogo delle statistiche, come il documento della collezione stats
+        self.events = EventLog()    # Eventi e snapshot delle aste, in memoria
+
+    async def next_auction_id(self):
+        self.last_auction_id += 1
+        return self.last_auction_id
+
+    async def exists(self, auction_id):
+        return auction_id in self.auctions
+
+    async def auction_started(self, auction_id, default=False):
+        self.auctions[auction_id] = new_document(auction_id, default)
+        self.summary["total_active_auctions"] = self.summary.get("total_active_auctions", 0) + 1
+        await self.events.record(auction_id, [start_event(auction_id)])
+
+    async def bids_added(self, auction_id, new_bids, fields):
+        # Prima il log (l'unico passo che può fallire, con MongoEventLog): un nuovo tentativo non duplica le offerte
+        await self.events.record(auction_id, order_events(auction_id, new_bids))
+        document = self.auctions[auction_id]
+        document["bid_history"].extend(new_bids)
+        document.update(fields)
+
+    async def auction_ended(self, auction, highest_bid, winner_id):
+        await self.events.record(auction.auction_id, [end_event(auction, highest_bid, winner_id)])
+        document = self.auctions[auction.auction_id]
+        document["is_active"] = False
+        self.summary["total_active_auctions"] -= 1
+        self.record_ended(document)
+
+    def record_ended(self, document):
+        summary = self.summary
+        summary["total_concluded_auctions"] = summary.get("total_concluded_auctions", 0) + 1
+        summary["sum_winning_bid"] = summary.get("sum_winning_bid", 0) + document["highest_bid"]
+        summary["total_bids"] = summary.get("total_bids", 0) + len(document["bid_history"])
+        summary["min_winning_bid"] = min(summary.get("min_winning_bid", document["highest_bid"]), document["highest_bid"])
+        summary["max_winning_bid"] = max(summary.get("max_winning_bid", document["highest_bid"]), document["highest_bid"])
+
+    async def load_active(self, auction_id=None):
+        active = [
+            document for document in self.auctions.values()
+            if document["is_active"] and (document["default"] if auction_id is None else document["auction_id"] == auction_id)
+        ]
+        if not active:
+            return None
+        document = max(active, key=lambda document: document["auction_id"])
+        watermarks = {}
+        for bid in document["bid_history"]:
+            if bid["message_id"]:
+                watermarks[bid["sender_id"]] = max(watermarks.get(bid["sender_id"], 0), bid["message_id"])
+        return dict(stored_fields(document), watermarks=watermarks)
+
+    async def load_ended(self, auction_id):
+        document = self.auctions.get(auction_id)
+        if document is None or document["is_active"]:
+            return None
+        return stored_fields(document)
+
+    async def read_auction(self, auction_id):
+        return self.auctions.get(auction_id)
+
+    async def read_bids(self, auction_id, since_sequence=None, limit=None):
+        document = self.auctions.get(auction_id)
+        if document is None:
+            return None
+        return slice_bid_history(document["bid_history"], since_sequence, limit)
+
+    async def state_at(self, auction_id, at_sequence=None):
+        return await self.events.state_at(auction_id, at_sequence)
+
+    async def all_auctions(self):
+        return [self.auctions[auction_id] for auction_id in sorted(self.auctions)]
+
+    async def find_auctions(self, fields="full", after_id=None, limit=AUCTIONS_PAGE):
+        auction_ids = sorted(auction_id for auction_id in self.auctions if after_id is None or auction_id > after_id)
+        page = [self.auctions[auction_id] for auction_id in auction_ids[:min(limit, MAX_AUCTIONS_PAGE)]]
+        if fields == "summary":
+            return [summary_document(document) for document in page]
+        return page
+
+    async def stats(self):
+        return summary_view(self.summary)
+
+    async def rebuild_stats(self):
+        self.summary = {"total_active_auctions": sum(document["is_active"] for document in self.auctions.values())}
+        for document in self.auctions.values():
+            if not document["is_active"]:
+                self.record_ended(document)
+        return summary_view(self.summary)
+
+class PersistOnEndStorage(MemoryStorage):
+    """
+    Le aste attive restano solo in memoria; alla chiusura ognuna viene salvata su MongoDB con un solo inserimento.
+    Le offerte non toccano mai il database, ma un riavvio perde le aste ancora aperte.
+    Le letture uniscono le aste attive in memoria e quelle concluse su MongoDB.
+    """
+
+    name = "persist_on_end"
+
+    def __init__(self):
+        super().__init__()
+        self.stored_events = MongoEventLog()  # Eventi delle aste concluse (quelli delle attive restano in self.events)
+
+    async def open(self):
+        await run_db(ensure_counters)
+        await run_db(ensure_stats)
+        await run_db(ensure_indexes)
+
+    async def close(self):
+        close()
+
+    async def fingerprint(self):
+        return await run_db(database_fingerprint)
+
+    async def next_auction_id(self):
+        # Stesso contatore degli altri backend su MongoDB: gli id restano unici anche cambiando backend
+        return await run_db(get_next_sequence_value, "auction_id")
+
+    async def exists(self, auction_id):
+        return await super().exists(auction_id) or await run_db(auction_collection.find_one, {"auction_id": auction_id}, {"_id": 1}) is not None
+
+    async def auction_started(self, auction_id, default=False):
+        self.auctions[auction_id] = new_document(auction_id, default)
+        await self.events.record(auction_id, [start_event(auction_id)])
+
+    async def auction_ended(self, auction, highest_bid, winner_id):
+        document = dict(self.auctions[auction.auction_id], is_active=False)
+        bids = document["bid_history"]
+        # Scritture ripetibili: se una fallisce l'asta resta in memoria e un "end" ritrasmesso le rifà senza duplicati
+        await run_db(replace_bids, auction.auction_id, bids)
+        await run_db(auction_collection.replace_one, {"auction_id": auction.auction_id}, persisted(document), upsert=True)
+        # Anche il log degli eventi passa su MongoDB in un colpo solo (l'end solo la prima volta)
+        if auction.auction_id in self.events.live:
+            await self.events.record(auction.auction_id, [end_event(auction, highest_bid, winner_id)])
+        await run_db(insert_events, self.events.events.get(auction.auction_id, []))
+        await run_db(insert_snapshots, self.events.snapshots.get(auction.auction_id, []))
+        # Salvata direttamente come conclusa: non era tra le aste attive del riepilogo
+        await run_db(record_auction_ended, document["highest_bid"], len(bids), was_active=False)
+        self.events.take(auction.auction_id)
+        del self.auctions[auction.auction_id]
+
+    async def load_ended(self, auction_id):
+        return await run_db(auction_collection.find_one, {"auction_id": auction_id, "is_active": False}, STORED_FIELDS)
+
+    async def read_auction(self, auction_id):
+        document = self.auctions.get(auction_id)
+        if document is not None:
+            return document
+        return await run_db(lambda: with_bid_history(auction_collection.find_one({"auction_id": auction_id}, {"_id": 0})))
+
+    async def read_bids(self, auction_id, since_sequence=None, limit=None):
+        if auction_id in self.auctions:
+            return await super().read_bids(auction_id, since_sequence, limit)
+        return await run_db(load_active_bid_history, since_sequence, limit, {"auction_id": auction_id})
+
+    async def state_at(self, auction_id, at_sequence=None):
+        if self.events.contains(auction_id):
+            return await super().state_at(auction_id, at_sequence)
+        return await self.stored_events.state_at(auction_id, at_sequence)
+
+    async def all_auctions(self):
+        stored = await run_db(load_all_auctions)
+        return sorted(stored + await super().all_auctions(), key=lambda auction: auction["auction_id"])
+
+    async def find_auctions(self, fields="full", after_id=None, limit=AUCTIONS_PAGE):
+        # Le due pagine sono ordinate e senza aste in comune: basta unirle e tagliarle
+        stored = await run_db(find_auctions, fields, after_id, limit)
+        active = await super().find_auctions(fields, after_id, limit)
+        return sorted(stored + active, key=lambda auction: auction["auction_id"])[:min(limit, MAX_AUCTIONS_PAGE)]
+
+    async def stats(self):
+        return dict(await run_db(read_stats), total_active_auctions=len(self.auctions))
+
+    async def rebuild_stats(self):
+        return dict(await run_db(rebuild_stats), total_active_auctions=len(self.auctions))
+
+class WriteThroughStorage(Storage):
+    """
+    Ogni offerta viene scritta su MongoDB prima dell'ack (o nel journal, se JOURNAL_PATH è impostato):
+    dopo un riavvio le aste attive riprendono dal database.
+    """
+
+    name = "write_through"
+
+    def __init__(self):
+        self.events = MongoEventLog()
+
+    async def open(self):
+        await run_db(ensure_counters)
+        await run_db(ensure_stats)
+        await run_db(ensure_indexes)
+        # Offerte confermate ma non ancora scritte su MongoDB prima dell'ultimo arresto (se il journal è attivo)
+        await run_db(recover)
+
+    async def close(self):
+        await flush()
+        close()
+
+    async def fingerprint(self):
+        return await run_db(database_fingerprint)
+
+    async def next_auction_id(self):
+        return await run_db(get_next_sequence_value, "auction_id")
+
+    async def exists(self, auction_id):
+        return await run_db(auction_collection.find_one, {"auction_id": auction_id}, {"_id": 1}) is not None
+
+    async def auction_started(self, auction_id, default=False):
+        try:
+            await run_db(auction_collection.insert_one, persisted(new_document(auction_id, default)))
+        except DuplicateKeyError:
+            raise AuctionExists(auction_id)
+        await run_db(record_auction_started)
+        await self.events.record(auction_id, [start_event(auction_id)])
+
+    async def bids_added(self, auction_id, new_bids, fields):
+        # Con il journal l'ack non aspetta MongoDB: le offerte vengono scritte a blocchi in background
+        try:
+            await write_bids(auction_id, new_bids, fields)
+        except Exception:
+            # Le offerte possono essere state salvate prima dell'errore: lo stato da cui calcolare gli snapshot
+            # verrà ricostruito dal log alla prossima scrittura
+            self.events.live.pop(auction_id, None)
+            raise
+        # Gli eventi order sono scritti da store_bids con le offerte: qui solo gli snapshot che cadono nel lotto
+        await self.events.record(auction_id, order_events(auction_id, new_bids))
+
+    async def auction_ended(self, auction, highest_bid, winner_id):
+        # Le offerte ancora nel journal vanno su MongoDB prima della chiusura
+        await flush()
+        await run_db(auction_collection.update_one, {"auction_id": auction.auction_id}, {"$set": {"is_active": False}})
+        await self.events.record(auction.auction_id, [end_event(auction, highest_bid, winner_id)])
+        # Per ultimo l'unica scrittura non ripetibile; ogni offerta incrementa il sequence_number di uno:
+        # coincide con il numero di offerte
+        await run_db(record_auction_ended, auction.stored["highest_bid"], auction.stored["sequence_number"])
+
+    async def load_active(self, auction_id=None):
+        # Le offerte ancora nel journal fanno parte dei contatori salvati
+        await flush()
+        return await run_db(load_active_auction, auction_id)
+
+    async def load_ended(self, auction_id):
+        return await run_db(auction_collection.find_one, {"auction_id": auction_id, "is_active": False}, STORED_FIELDS)
+
+    async def read_auction(self, auction_id):
+        return await run_db(lambda: with_bid_history(auction_collection.find_one({"auction_id": auction_id}, {"_id": 0})))
+
+    async def read_bids(self, auction_id, since_sequence=None, limit=None):
+        return await run_db(load_active_bid_history, since_sequence, limit, {"auction_id": auction_id})
+
+    async def state_at(self, auction_id, at_sequence=None):
+        # Gli eventi order ancora nel journal vanno prima su MongoDB
+        await flush()
+        return await self.events.state_at(auction_id, at_sequence)
+
+    async def all_auctions(self):
+        return await run_db(load_all_auctions)
+
+    async def find_auctions(self, fields="full", after_id=None, limit=AUCTIONS_PAGE):
+        return await run_db(find_auctions, fields, after_id, limit)
+
+    async def stats(self):
+        # Legge il riepilogo mantenuto in modo incrementale da start/end
+        return await run_db(read_stats)
+
+    async def rebuild_stats(self):
+        return await run_db(rebuild_stats)
+
+def load_active_auction(auction_id=None):
+    """
+    Legge dal database un'asta attiva (senza auction_id: la predefinita più recente) e i message_id già registrati.
+    Chiamata bloccante, da eseguire nel pool di thread.
+    """
+    query = {"is_active": True}
+    if auction_id is None:
+        # Non un'asta parallela avviata con un auction_id esplicito
+        query["default"] = True
+    else:
+        query["auction_id"] = auction_id
+    stored = auction_collection.find_one(query, STORED_FIELDS, sort=[("auction_id", -1)])
+    if stored:
+        stored["watermarks"] = load_message_watermarks(stored["auction_id"])
+    return stored
+
+backends = {
+    "memory": MemoryStorage,
+    "write_through": WriteThroughStorage,
+    "persist_on_end": PersistOnEndStorage
+}
+
+def create_storage(name=STORAGE_BACKEND):
+    if name not in backends:
+        raise ValueError(f"Unknown STORAGE_BACKEND {name!r}, expected one of: {', '.join(backends)}")
+    return backends[name]()
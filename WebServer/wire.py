@@ -0,0 +1,111 @@
+import json
+import os
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:  # Serve solo per i client che inviano MessagePack
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # Serve solo per i client che inviano CBOR
+    cbor2 = None
+
+try:
+    import orjson
+except ImportError:  # Senza orjson le risposte JSON usano il modulo json
+    orjson = None
+
+# Risposta di /receive-data: "full" (stato completo dell'asta) oppure "compact" (solo l'ack)
+ACK_MODE = os.environ.get("ACK_MODE", "full")
+
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+JSON = "application/json"
+
+# Formati binari accettati: media type -> (decodifica, codifica)
+codecs = {}
+if msgpack is not None:
+    for name in (MSGPACK, "application/x-msgpack", "application/vnd.msgpack"):
+        codecs[name] = (msgpack.unpackb, msgpack.packb)
+if cbor2 is not None:
+    codecs[CBOR] = (cbor2.loads, cbor2.dumps)
+
+BINARY_TYPES = {MSGPACK, "application/x-msgpack", "application/vnd.msgpack", CBOR}
+
+def media_type(header):
+    return (header or "").split(";")[0].strip().lower()
+
+def encode_json(content):
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, separators=(",", ":"), default=str).encode()
+
+async def decoded_request(request, name):
+    """
+    Decodifica il corpo binario e lo presenta a FastAPI come JSON già letto, senza passare da un testo JSON.
+    """
+    if name not in codecs:
+        raise HTTPException(status_code=415, detail=f"{name} requires the {'cbor2' if name == CBOR else 'msgpack'} package")
+    body = await request.body()
+    try:
+        content = codecs[name][0](body)
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} body")
+
+    headers = [(key, value) for key, value in request.scope["headers"] if key != b"content-type"]
+    headers.append((b"content-type", JSON.encode()))
+    # wire_format ricorda il formato del client per la risposta
+    request = Request(dict(request.scope, headers=headers, wire_format=name), request.receive)
+    request._body = body
+    request._json = content
+    return request
+
+class WireRoute(APIRoute):
+    """
+    Route che accetta, oltre al JSON, corpi MessagePack o CBOR con gli stessi modelli pydantic.
+    Si attiva con app.router.route_class = WireRoute prima di dichiarare gli endpoint.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def wire_handler(request):
+            name = media_type(request.headers.get("content-type"))
+            if name in BINARY_TYPES:
+                request = await decoded_request(request, name)
+            return await handler(request)
+
+        return wire_handler
+
+def response_format(request):
+    """
+    Formato della risposta: il primo tipo supportato elencato in Accept (i pesi q non sono considerati),
+    altrimenti quello del corpo della richiesta, altrimenti JSON.
+    """
+    for accepted in request.headers.get("accept", "").split(","):
+        name = media_type(accepted)
+        if name == JSON or name in codecs:
+            return name
+    return request.scope.get("wire_format", JSON)
+
+def respond(request, content):
+    """
+    Serializza direttamente la risposta nel formato del client: FastAPI non la riconverte con jsonable_encoder.
+    """
+    name = response_format(request)
+    if name in codecs:
+        return Response(codecs[name][1](content), media_type=name)
+    return Response(encode_json(content), media_type=JSON)
+
+def compact(ack):
+    """
+    True se la risposta deve contenere solo l'ack (?ack=compact, oppure ACK_MODE=compact).
+    """
+    return (ack or ACK_MODE) == "compact"
+
+def compact_ack(status, auction_id, sequence_number):
+    return {"status": status, "auction_id": auction_id, "sequence_number": sequence_number}